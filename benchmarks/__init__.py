@@ -0,0 +1,4 @@
+"""Benchmarks of the sampling, SBAE and export hot paths against a fake Earth Engine.
+
+Run them from the root of the repository with ``python -m benchmarks``.
+"""
@@ -0,0 +1,106 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks import fake_ee
+
+
+def measure(function, backend, repeat):
+    """returns the best wall time, the peak memory and the round trips of function"""
+
+    times, peak = [], 0
+    for _ in range(repeat):
+
+        backend.reset()
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        function()
+
+        times.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        "wall_s": min(times),
+        "peak_mb": peak / 2**20,
+        "round_trips": backend.round_trips,
+        "payload_kb": backend.payload / 2**10,
+    }
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-k", "--filter", default="", help="run matching scenarios")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per call")
+    parser.add_argument(
+        "--reduction-time", type=float, default=0.0, help="seconds per reduceRegion"
+    )
+    parser.add_argument("--concurrency", type=int, default=40, help="server slots")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--compare", help="json file of a previous run")
+    parser.add_argument(
+        "--tolerance", type=float, default=1.25, help="allowed slow down ratio"
+    )
+    args = parser.parse_args(argv)
+
+    backend = fake_ee.Backend(
+        latency=args.latency,
+        concurrency=args.concurrency,
+        reduction_time=args.reduction_time,
+    )
+    fake_ee.install(backend)
+
+    # component modules import ee, they must be loaded after the fake is installed
+    from benchmarks.scenarios import SCENARIOS, cases
+
+    results = {}
+    for name in SCENARIOS:
+        if args.filter not in name:
+            continue
+
+        for params in cases(name):
+
+            case = f"{name}[{','.join(f'{k}={v}' for k, v in params.items())}]"
+
+            try:
+                function = SCENARIOS[name][0](backend, **params)
+            except ImportError as e:
+                print(f"{case:<75} skipped ({e})")
+                continue
+
+            results[case] = measure(function, backend, args.repeat)
+            print(
+                "{:<75} {wall_s:>9.4f}s {peak_mb:>9.1f}MB {round_trips:>5} calls".format(
+                    case, **results[case]
+                )
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        regressions = [
+            case
+            for case, result in results.items()
+            if case in baseline
+            and result["wall_s"] > baseline[case]["wall_s"] * args.tolerance
+        ]
+        for case in regressions:
+            print(f"regression: {case}")
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""Local stand-in for the earthengine-api.
+
+Every ee object is a lazy node recording the chain of calls that built it, as the real
+client library does. Only getInfo (and task.start) reach the "server": the call is
+counted, delayed by the configured latency and answered with a synthetic payload whose
+shape matches what the app expects from that chain.
+"""
+
+import json
+import sys
+import threading
+import time
+import types
+
+__all__ = ["Backend", "Node", "install", "uninstall"]
+
+
+class Backend:
+    """Simulated Earth Engine server.
+
+    Args:
+        latency (float): seconds spent by each round trip
+        n_classes (int): number of classes of the categorical images
+        n_features (int): size of every feature collection
+        concurrency (int): maximum number of requests served at the same time, the
+            other ones wait as they would in the EE queue
+        reduction_time (float): extra server seconds spent by each reduceRegion
+    """
+
+    def __init__(
+        self,
+        latency=0.05,
+        n_classes=10,
+        n_features=10000,
+        concurrency=40,
+        reduction_time=0.0,
+    ):
+
+        self.latency = latency
+        self.reduction_time = reduction_time
+        self.n_classes = n_classes
+        self.n_features = n_features
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """reset the request counters"""
+
+        self.round_trips = 0
+        self.payload = 0
+
+    def request(self, node):
+        """serve a getInfo request"""
+
+        reductions = node._calls("reduceRegion")
+
+        with self.slots:
+            time.sleep(self.latency + self.reduction_time * reductions)
+
+        response = self.respond(node)
+
+        with self.lock:
+            self.round_trips += 1
+            self.payload += len(json.dumps(response))
+
+        return response
+
+    def classes(self, scale=1):
+        return {str(10 * (i + 1)): scale * (i + 1) for i in range(self.n_classes)}
+
+    def features(self, start, count):
+        """returns count point features starting at the given position"""
+
+        count = max(min(count, self.n_features - start), 0)
+
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "id": f"{i:010d}",
+                    "geometry": {"type": "Point", "coordinates": [i * 1e-5, -i * 1e-5]},
+                    "properties": {},
+                }
+                for i in range(start, start + count)
+            ],
+        }
+
+    def respond(self, node):
+        """build the payload answering the chain of the node"""
+
+        names = [name for name, _, _ in node.chain]
+        last, args, _ = node.chain[-1]
+
+        if last == "size":
+            return self.n_features
+
+        elif last == "nominalScale":
+            return 30
+
+        elif last == "fromLists":
+            return self.classes(scale=1e3 if "pixelArea" in names else 1)
+
+        elif last == "get" and "reduceColumns" in names and node._calls("group") < 2:
+            # class groups of the points of a single design
+            return [
+                {"group": int(key), "sum": value}
+                for key, value in self.classes().items()
+            ]
+
+        elif last == "get" and {"reduceRegion", "reduceColumns"} & set(names):
+            # grouped (tag, class) reduction of the single pass SBAE
+            return [
+                {
+                    "group": tag,
+                    "groups": [
+                        {"group": int(key), "sum": tag * value}
+                        for key, value in self.classes().items()
+                    ],
+                }
+                for tag in range(1, 17)
+            ]
+
+        elif last == "limit":
+            cursor = node._find("gt")
+            start = int(cursor[1]) + 1 if cursor else 0
+            return self.features(start, args[0])
+
+        elif last == "slice" and "aggregate_array" in names:
+            # boundaries of the sorted system:index
+            start, _, step = args
+            return [f"{i:010d}" for i in range(start, self.n_features, step)]
+
+        elif node._find("toList"):
+            count, offset = (list(node._find("toList")) + [0])[:2]
+            return self.features(offset, count)
+
+        elif last in ("aggregate_array", "propertyNames"):
+            return [str(i) for i in range(self.n_classes)]
+
+        return {}
+
+
+class Node:
+    """Lazy ee object. Any attribute or call returns a new node with a longer chain"""
+
+    backend = None
+
+    def __init__(self, chain=()):
+        self.chain = tuple(chain)
+
+    def __getattr__(self, name):
+
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        return Method(self, name)
+
+    def __call__(self, *args, **kwargs):
+        return Node(self.chain + (("__call__", args, kwargs),))
+
+    def _find(self, name):
+        """returns the arguments of the last call to name in the chain (or its args)"""
+
+        for chain_name, args, _ in reversed(self.chain):
+            if chain_name == name:
+                return args
+            for arg in args:
+                if isinstance(arg, Node) and arg._find(name):
+                    return arg._find(name)
+
+        return None
+
+    def _calls(self, name):
+        """returns how many times name is called to build the node"""
+
+        total = 0
+        for chain_name, args, kwargs in self.chain:
+            total += chain_name == name
+            for arg in list(args) + list(kwargs.values()):
+                total += arg._calls(name) if isinstance(arg, Node) else 0
+
+        return total
+
+    def getInfo(self):
+        return Node.backend.request(self)
+
+    def serialize(self):
+        return repr(self.chain)
+
+    @property
+    def id(self):
+        return f"fake_task_{abs(hash(self.chain))}"
+
+    def start(self):
+        Node.backend.request(self)
+
+
+class Method:
+    def __init__(self, node, name):
+        self.node = node
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+        return Node(self.node.chain + ((self.name, args, kwargs),))
+
+    def __getattr__(self, name):
+        return getattr(self(), name)
+
+
+class EEException(Exception):
+    pass
+
+
+class FakeModule(types.ModuleType):
+    """ee module. Top level names are nodes (ee.Image, ee.Reducer, ee.data...)"""
+
+    EEException = EEException
+
+    def __getattr__(self, name):
+
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        return Node(((name, (), {}),))
+
+    @staticmethod
+    def Initialize(*args, **kwargs):
+        return
+
+
+_saved = {}
+
+
+def install(backend):
+    """replace the ee module by the fake one, served by the given backend"""
+
+    Node.backend = backend
+
+    module = FakeModule("ee")
+    module.ee_exception = types.SimpleNamespace(EEException=EEException)
+
+    for name in ["ee", "ee.ee_exception"]:
+        _saved.setdefault(name, sys.modules.get(name))
+
+    sys.modules["ee"] = module
+    sys.modules["ee.ee_exception"] = module.ee_exception
+
+    return module
+
+
+def uninstall():
+    """restore the modules replaced by install"""
+
+    for name, module in _saved.items():
+        if module is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = module
+
+    _saved.clear()
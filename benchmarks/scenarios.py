@@ -0,0 +1,135 @@
+"""Benchmark scenarios of the sampling, SBAE and export hot paths.
+
+Each scenario receives the fake backend and one combination of its parameters, does
+its setup and returns the callable that is timed. The fake ee module has to be
+installed before this module imports anything from component.
+"""
+
+import itertools
+import tempfile
+import types
+from pathlib import Path
+
+__all__ = ["SCENARIOS", "scenario", "cases"]
+
+SCENARIOS = {}
+"dict: registered scenarios {name: (function, parameter grid)}"
+
+
+def scenario(name, **grid):
+    """register a scenario with the grid of parameters to benchmark"""
+
+    def decorator(function):
+        SCENARIOS[name] = (function, grid)
+        return function
+
+    return decorator
+
+
+def cases(name):
+    """yields every parameter combination of the scenario"""
+
+    grid = SCENARIOS[name][1]
+    for values in itertools.product(*grid.values()):
+        yield dict(zip(grid.keys(), values))
+
+
+class Alert:
+    """stand-in of sw.Alert"""
+
+    def update_progress(self, progress):
+        self.progress = progress
+
+
+def make_model(
+    aoi_km=100, grid_size=5000, method="systematic", seed=1, n_points=1, shape="square"
+):
+    """returns a sbae Model over a square AOI of aoi_km side"""
+
+    import ee
+    import shapely
+
+    from component.model import Model
+
+    aoi = shapely.box(0, 0, aoi_km * 1e3, aoi_km * 1e3)
+    aoi_model = types.SimpleNamespace(
+        name="bench",
+        feature_collection=ee.FeatureCollection(f"bench/aoi_{aoi_km}"),
+        gdf=types.SimpleNamespace(
+            to_crs=lambda crs: types.SimpleNamespace(unary_union=aoi)
+        ),
+    )
+
+    model = Model(aoi_model)
+    model.method = method
+    model.shape = shape
+    model.grid_size = grid_size
+    model.seed = seed
+    model.n_points = n_points
+
+    return model
+
+
+@scenario(
+    "create_sample",
+    engine=["gee", "local"],
+    method=["systematic", "random"],
+    aoi_km=[100, 500],
+    grid_size=[1000, 5000],
+    shape=["square", "hexagon"],
+)
+def bench_create_sample(backend, engine, method, aoi_km, grid_size, shape):
+
+    model = make_model(aoi_km, grid_size, method, shape=shape)
+
+    return lambda: model.create_sample(engine)
+
+
+@scenario(
+    "simulate_areas",
+    single_pass=[False, True],
+    n_classes=[10, 40],
+    point_sampling=[True, False],
+)
+def bench_simulate_areas(backend, single_pass, n_classes, point_sampling):
+
+    import ee
+
+    import component.scripts.gee_sbae as gee_sbae
+    from component.scripts.cache import ResultCache
+
+    backend.n_classes = n_classes
+    model = make_model()
+    model.point_sampling = point_sampling
+    gee_sbae.cache = ResultCache(folder=Path(tempfile.mkdtemp()))
+
+    return lambda: gee_sbae.simulate_areas(
+        model, ee.Image("bench/landcover"), single_pass=single_pass, refresh=True
+    )
+
+
+@scenario("get_sbae_error", n_classes=[10, 100], n_grid_sizes=[8, 50])
+def bench_get_sbae_error(backend, n_classes, n_grid_sizes):
+
+    from component.scripts.processing import get_sbae_error
+
+    real = {str(c): float(c + 1) for c in range(n_classes)}
+    simulated = {
+        1000 * (g + 1): {str(c): float(c + g + 1) for c in range(n_classes)}
+        for g in range(n_grid_sizes)
+    }
+
+    return lambda: get_sbae_error(simulated, real)
+
+
+@scenario("points_to_dataframe", n_features=[10000, 100000], batch_size=[5000])
+def bench_points_to_dataframe(backend, n_features, batch_size):
+
+    import ee
+
+    backend.n_features = n_features
+    model = make_model()
+    model.points = ee.FeatureCollection("bench/points")
+    model.nsamples = n_features
+
+    return lambda: model.points_to_dataframe(Alert(), batch_size)
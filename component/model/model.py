@@ -1,20 +1,22 @@
-import concurrent.futures
 from pathlib import Path
 
 import ee
-import geopandas as gpd
-import pandas as pd
+import numpy as np
 import sepal_ui.scripts.utils as su
 from sepal_ui.model import Model
+from sepal_ui.scripts.decorator import need_ee
 from sepal_ui.scripts.gee import get_assets
-from traitlets import Bool, CInt, Int, Unicode
+from traitlets import Bool, CInt, Int, List, Unicode, observe
 
+import component.parameter as param
 import component.parameter.directory as dir_
+import component.scripts.download as download
 import component.scripts.gee_sampling as gee
+import component.scripts.writers as writers
 from component.message import cm
 from component.scripts import scripts
-
-ee.Initialize()
+from component.scripts.prepared_aoi import PreparedAoi
+from component.scripts.scheduler import scheduler
 
 
 class Model(Model):
@@ -22,7 +24,7 @@ class Model(Model):
     method = Unicode().tag(sync=True)
     "str: sampling method. either systematic or random"
     export_method = Unicode().tag(sync=True)
-    "str: exportation method method. either local (.csv, .gpkg, .shp) or asset"
+    "str: exportation method method. either local (.csv, .gpkg, .shp, .parquet) or asset"
     shape = Unicode().tag(sync=True)
     "str: shape of the grid cell. the value will be used to create the grid."
     grid_size = CInt().tag(sync=True)
@@ -34,16 +36,44 @@ class Model(Model):
     "int: numbers of points to create within each cell. Only available when using random sampling method."
     seed = Int().tag(sync=True)
     "int: seed used to create random points"
-    points = None
-    "ee.FeatureCollection: sample points derived from the user inputs"
+    engine = Unicode("gee").tag(sync=True)
+    "str: engine used to create the grid and the samples. either gee or local (numpy)"
+    sample = None
+    "LocalSample: sample points as coordinate arrays when using the local engine"
     nsamples = None
     "int: Total number of sampled points. It is the size of the points feature collection"
+    estimated_nsamples = None
+    "int: expected number of sampled points, used until nsamples is known"
     samples_gdf = None
     "GeoDataFrame: geodataframe containing all the samples geometries with their own index"
     ready = Bool(False).tag(sync=True)
     "bool: trait to control either the samples are already created or not"
+    allocation = Unicode("proportional").tag(sync=True)
+    "str: allocation of the points to the strata of strat_random. either proportional, equal or neyman"
+    cat_image = None
+    "ee.Image or LocalRaster: categorical image selected for the SBAE, used as strata by strat_random"
+    clip = Bool(True).tag(sync=True)
+    "bool: drop the sample points falling outside the AOI (in the cells crossing its boundary)"
+    bulk_download = Bool(True).tag(sync=True)
+    "bool: download the EE points of the local exports as CSV files instead of pages of features"
     gee_format = Unicode("").tag(sync=True)
     "str: file format when using export methods as asset"
+    sbae_grid_sizes = List(CInt()).tag(sync=True)
+    "list: grid sizes (m) of the SBAE curve. Empty to use grid_size times param.GRID_MULTIPLIERS"
+    reduction_scale = CInt(0).tag(sync=True)
+    "int: scale (m) of the SBAE reductions. 0 to choose it from the image, the AOI area and the grid size"
+    pyramid = Bool(True).tag(sync=True)
+    "bool: snap the automatic reduction scale to the pyramid levels of the image (native scale times 2^k)"
+    best_effort = Bool(False).tag(sync=True)
+    "bool: let EE coarsen the reductions exceeding param.REDUCTION_PIXELS instead of failing"
+    tile_scale = CInt(1).tag(sync=True)
+    "int: tileScale of the SBAE reductions, higher values use less memory per EE tile"
+    point_sampling = Bool(True).tag(sync=True)
+    "bool: read the categorical image at the sample points (sampleRegions) instead of rasterizing the samples and reducing the whole AOI"
+    shard_size = CInt(0).tag(sync=True)
+    "int: approximate side (m) of the shards of the GEE SBAE, 0 to reduce the whole AOI at once"
+    sbae_scale = None
+    "float: scale (m) of the reductions of the last SBAE"
 
     def __init__(self, aoi_model):
 
@@ -51,108 +81,236 @@ class Model(Model):
         self.grid = None
         self.points = None
         self.nsamples = None
+        self.local_grid = None
+        self.sample = None
+        self._prepared_aoi = None
+
+    @observe("grid_size")
+    def _reset_sbae_grid_sizes(self, change):
+        """the custom SBAE grid sizes were chosen for the previous grid size, fall back
+        on the default multiples of the new one"""
+
+        self.sbae_grid_sizes = []
+
+    @property
+    def prepared_aoi(self):
+        """PreparedAoi: AOI projected in out_crs and simplified to a tolerance of
+        param.AOI_TOLERANCE times the grid size. Rebuilt when one of them changes"""
+
+        tolerance = param.AOI_TOLERANCE * self.grid_size
+
+        aoi = self._prepared_aoi
+        if aoi is None or not aoi.matches(self.aoi_model, self.out_crs, tolerance):
+            aoi = PreparedAoi(self.aoi_model, self.out_crs, tolerance)
+            self._prepared_aoi = aoi
+
+        return aoi
+
+    @property
+    def grid(self):
+        """ee.FeatureCollection: grid cells. Uploaded on demand when using the local engine"""
+
+        if self._grid is None and self.local_grid is not None:
+            self._grid = self.local_grid.to_feature_collection()
+
+        return self._grid
+
+    @grid.setter
+    def grid(self, value):
+        self._grid = value
 
-    def create_sample(self):
-        """Create sampling desing within the grid based on the strategy"""
+    @property
+    def points(self):
+        """ee.FeatureCollection: sample points derived from the user inputs. Uploaded
+        on demand when using the local engine"""
+
+        if self._points is None and self.sample is not None:
+            self._points = self.sample.to_feature_collection()
+
+        return self._points
+
+    @points.setter
+    def points(self, value):
+        self._points = value
+
+    def create_sample(self, engine=None):
+        """Create sampling desing within the grid based on the strategy
+
+        Args:
+            engine (str, optional): either gee or local. Defaults to model.engine
+        """
 
         self.ready = False
 
+        # requests about the previous sample (e.g. its size) are not needed anymore
+        scheduler.cancel("design")
+
+        self.grid = None
+        self.points = None
+        self.local_grid = None
+        self.sample = None
+        self.nsamples = None
+        self.estimated_nsamples = None
+
         # We are passing the model (self) and grid_size, because the functions will use
         # some default parameters from the model (self) and can vary the second parameter
-        self.grid = gee.get_grid(self, self.grid_size)
-        self.points = gee.create_sample(self, self.grid)
+        if (engine or self.engine) == "local":
+
+            import component.scripts.local_sampling as local
+
+            aoi = self.prepared_aoi.index
+            self.local_grid = local.get_grid(self, self.grid_size, aoi)
+            self.sample = local.create_sample(self, self.local_grid, self.cat_image)
+            if self.clip:
+                self.sample = local.clip_sample(self.sample, self.local_grid, aoi)
+            self.nsamples = len(self.sample)
+        else:
+            self.grid = gee.get_grid(self, self.grid_size)
+            self.points = gee.create_sample(self, self.grid)
+            if self.clip:
+                self.points = self.points.filterBounds(self.prepared_aoi.ee_geometry)
 
         self.ready = True
 
-    def points_to_dataframe(self, alert):
-        """Retrieve points from GEE concurrently and save the geodataframe in the model"""
-
-        def get_features(offset):
-            """converts fc into a batch_size list with a given offset"""
-            return ee.FeatureCollection(
-                self.points.toList(batch_size, offset)
-            ).getInfo()
-
-        workers = 4
-        batch_size = min(int(self.nsamples / workers), 5000)
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-            # Define an offset list to skip elements at each iteration
-            offsets = [0] + [
-                x * batch_size for x in range(1, (self.nsamples // batch_size) + 1)
-            ]
-            futures = [executor.submit(get_features, offset) for offset in offsets]
-            results = []
-            progress = 0
-            for future in concurrent.futures.as_completed(futures):
-                results.append(future.result())
-                progress += 1 / len(offsets)
-                alert.update_progress(progress)
+    def iter_coordinates(self, batch_size=5000):
+        """Yields the lon/lat (EPSG:4326) float64 arrays of the sample points by batches
+        of at most batch_size points, always in the same order. No geometry object is
+        created and only one batch is held in memory at a time."""
+
+        # Samples created locally don't need any round trip to the server
+        if self.sample is not None:
+
+            from pyproj import Transformer
+
+            transformer = Transformer.from_crs(
+                self.out_crs, "EPSG:4326", always_xy=True
+            )
+            for start in range(0, len(self.sample), batch_size):
+                yield transformer.transform(
+                    self.sample.x[start : start + batch_size],
+                    self.sample.y[start : start + batch_size],
+                )
+            return
+
+        for features in download.iter_features(self.points, batch_size):
+            yield download.features_coordinates(features)
+
+    def _track_progress(self, batches, alert, batch_size):
+        """update the alert progress while iterating over the batches"""
+
+        nsamples = self.nsamples or self.estimated_nsamples
+        total = -(-nsamples // batch_size) if nsamples else None
+
+        for i, batch in enumerate(batches, 1):
+            yield batch
+            if alert and total:
+                alert.update_progress(min(i / total, 1))
+
+        if alert:
             alert.update_progress(1)
 
+    def points_to_dataframe(self, alert, batch_size=5000):
+        """Retrieve points from GEE by batches and save the geodataframe in the model"""
+
+        import geopandas as gpd
+
+        batches = self._track_progress(
+            self.iter_coordinates(batch_size), alert, batch_size
+        )
+        lon, lat = [np.concatenate(c) for c in zip(*batches)] or [[], []]
+
         self.samples_gdf = gpd.GeoDataFrame(
-            pd.concat([gpd.GeoDataFrame.from_features(result) for result in results])
+            geometry=gpd.points_from_xy(lon, lat), crs="EPSG:4326"
         ).reset_index()
 
-    def export_result(self, folder=None):
-        """Export sample design points to the given format"""
+    def export_result(self, folder=None, alert=None, batch_size=5000, filename=None):
+        """Export sample design points to the given format. Local formats (csv, gpkg,
+        shp and parquet) are written batch by batch while the points are downloaded,
+        EE points are downloaded as CSV chunks when bulk_download is set. Asset and
+        drive tasks are monitored in the background, their status is reported in the
+        alert. Earth Engine is only initialized by the asset and drive tasks and the
+        download of EE points, local samples are written offline.
 
-        filename = scripts.get_filename(self, f".{self.export_method}")
+        Args:
+            folder (str, optional): asset folder of the asset exports
+            alert (sw.Alert, optional): alert reporting the progress
+            batch_size (int): number of points written at once
+            filename (pathlib.Path, optional): file of the local exports, its stem
+                names the asset and drive exports. Defaults to scripts.get_filename
+        """
+
+        filename = filename or scripts.get_filename(self, f".{self.export_method}")
 
         if self.export_method in ["asset", "gdrive"]:
+            return self._start_export_task(filename, folder, alert)
+
+        # EE points are downloaded by the need_ee functions of the download module
+        if self.sample is None and self.bulk_download:
 
-            options = {
-                "collection": self.points,
-                "description": filename.stem,
-            }
+            batch_size = param.DOWNLOAD_CHUNK
+            batches = download.iter_csv_chunks(self.points, batch_size, group="export")
+        else:
+            batches = self.iter_coordinates(batch_size)
 
-            if self.export_method == "gdrive":
-                task_fn = ee.batch.Export.table.toDrive
-                options.update(folder="sampling_test", fileFormat=self.gee_format)
+        with writers.get_writer(filename, self.export_method) as writer:
+            for lon, lat in self._track_progress(batches, alert, batch_size):
+                writer.write(lon, lat)
 
-            elif self.export_method == "asset":
+        return cm.export.success_msg.local.format(filename.name)
 
-                folder = folder or ee.data.getAssetRoots()[0]["id"]
-                asset_id = str(Path(folder, filename.stem))
-                print(asset_id)
+    @need_ee
+    def _start_export_task(self, filename, folder=None, alert=None):
+        """start the asset or drive export task of the points and monitor it in the
+        alert"""
 
-                # check if the name already exist
-                current_assets = [asset["name"] for asset in get_assets(folder)]
+        options = {
+            "collection": self.points,
+            "description": filename.stem,
+        }
 
-                # An user could export the same asset more than one time
-                # Let's create an unique id
-                while asset_id in current_assets:
-                    asset_id = su.next_string(asset_id)
+        if self.export_method == "gdrive":
+            task_fn = ee.batch.Export.table.toDrive
+            options.update(folder="sampling_test", fileFormat=self.gee_format)
 
-                task_fn = ee.batch.Export.table.toAsset
-                options.update(assetId=asset_id)
+        elif self.export_method == "asset":
 
-            task = task_fn(**options)
-            task.start()
+            folder = folder or ee.data.getAssetRoots()[0]["id"]
+            asset_id = str(Path(folder, filename.stem))
+            print(asset_id)
 
-            return cm.export.success_msg.local.format(filename.stem, task.id)
+            # check if the name already exist
+            current_assets = [asset["name"] for asset in get_assets(folder)]
 
-        else:
+            # An user could export the same asset more than one time
+            # Let's create an unique id
+            while asset_id in current_assets:
+                asset_id = su.next_string(asset_id)
+
+            task_fn = ee.batch.Export.table.toAsset
+            options.update(assetId=asset_id)
+
+        task = task_fn(**options)
+        task.start()
+
+        if alert:
+            self._monitor_task(task, alert)
 
-            drivers = {
-                "gpkg": "GPKG",
-                "shp": "ESRI Shapefile",
-            }
-            gdf = self.samples_gdf
+        return cm.export.success_msg.asset.format(filename.stem, task.id)
 
-            gdf["LON"] = gdf["geometry"].x
-            gdf["LAT"] = gdf["geometry"].y
+    def _monitor_task(self, task, alert):
+        """poll the export task in the background and report its status in the alert"""
 
-            # sort columns for CEO output
-            gdf["PLOTID"] = gdf.index
-            cols = gdf.columns.tolist()
-            cols = [e for e in cols if e not in ("LON", "LAT", "PLOTID")]
-            new_cols = ["PLOTID", "LAT", "LON"] + cols
-            gdf = gdf[new_cols]
+        def on_status(status):
+            alert.add_msg(cm.export.task_status.format(task.id, status["state"]))
 
-            if self.export_method == "csv":
-                gdf[["PLOTID", "LAT", "LON"]].to_csv(filename, index=False)
+        def done(future):
+            error = future.exception()
+            if error is not None:
+                alert.add_msg(cm.export.task_failed.format(task.id, error), "error")
             else:
-                gdf.to_file(filename, driver=drivers[self.export_method])
+                alert.add_msg(cm.export.task_done.format(task.id), "success")
 
-            return cm.export.success_msg.local.format(filename.name)
+        future = scheduler.submit(
+            download.wait_task, task, on_status=on_status, group="export"
+        )
+        future.add_done_callback(done)
@@ -1 +1,46 @@
 from component.message import cm
+
+GRID_MULTIPLIERS = [1, 2, 3, 4, 5, 10, 20, 50]
+"list: factors applied to the user grid size to build the SBAE error curve"
+
+AOI_TOLERANCE = 0.01
+"float: simplification tolerance of the AOI, as a share of the grid size. 0 to keep every vertex"
+
+REDUCTION_PIXELS = 1e9
+"float: target number of pixels of a SBAE reduction over the AOI, used to choose its scale"
+
+DOWNLOAD_CHUNK = 100000
+"int: number of points of each CSV file downloaded from EE by the local exports"
+
+DOWNLOAD_PREFETCH = 2
+"int: number of CSV chunks downloaded in advance while the current one is written"
+
+UPLOAD_BATCH = 50000
+"int: number of points of each geometry uploaded to EE by the local engine"
+
+LATTICE_TILE = 50000
+"int: maximum number of candidate cells of each server side list of an hexagonal or triangular grid"
+
+TASK_POLL = 5
+"float: first delay (s) between two status requests of an EE export task, doubled up to 1 min"
+
+SHARD_SIZE = 200000
+"int: approximate side (m) of the shards of a sharded SBAE, rounded to a multiple of the largest grid size"
+
+MAX_RUNNING_SHARDS = 8
+"int: number of shards computed at the same time, each one sends up to 2 requests"
+
+SHARD_RETRIES = 2
+"int: retries of a failing shard before the sharded SBAE fails"
+
+BATCH_WORKERS = 4
+"int: number of jobs of a headless batch run at the same time"
+
+MIN_CLASS_SHARE = 0.01
+"float: classes covering less than this share of the AOI are ignored by the grid size search"
+
+EXPECTED_ACCURACY = 0.9
+"float: anticipated user's accuracy of the strata, used by the Neyman allocation"
+
+RARE_CLASS_ACCURACY = 0.7
+"float: anticipated user's accuracy of the strata covering less than MIN_CLASS_SHARE"
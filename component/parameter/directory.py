@@ -4,12 +4,18 @@ __all__ = [
     "BASE_DIR",
     "ROOT_DIR",
     "SAMPLES_DIR",
+    "CACHE_DIR",
+    "BATCH_DIR",
 ]
 
 BASE_DIR = Path("~", "module_results").expanduser()
 ROOT_DIR = BASE_DIR / "sbae-ui"
 SAMPLES_DIR = ROOT_DIR / "samples"
+CACHE_DIR = ROOT_DIR / "cache"
+BATCH_DIR = ROOT_DIR / "batch"
 
 BASE_DIR.mkdir(exist_ok=True)
 ROOT_DIR.mkdir(parents=True, exist_ok=True)
 SAMPLES_DIR.mkdir(parents=True, exist_ok=True)
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+BATCH_DIR.mkdir(parents=True, exist_ok=True)
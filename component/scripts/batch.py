@@ -0,0 +1,368 @@
+"""Headless sample designs and SBAE runs.
+
+Reads a job spec listing AOIs and designs, runs every (AOI, design) job in a
+bounded pool of workers and writes the SBAE errors, the sample points and a run
+summary. Usage:
+
+    python -m component.scripts.batch job.yaml [--workers 4] [--output DIR]
+
+A job spec (YAML needs pyyaml, JSON works everywhere) looks like:
+
+    workers: 4
+    defaults: {method: systematic, shape: square, out_crs: "EPSG:3857"}
+    aois:
+      - {name: kenya, admin: 110}
+      - {name: site, asset: users/me/site}
+    designs:
+      - name: sys5k
+        grid_size: 5000
+        sbae: {image: users/me/landcover, seeds: 1}
+        export: csv
+
+AOI entries are the arguments of sepal_ui.aoi.AoiModel. Design entries are members
+of the Model (defaults are applied first), plus the optional sbae (image, band, seeds
+and processes) and export (export method of the sample points) sections.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import json
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+import component.parameter as param
+import component.parameter.directory as dir_
+from component.message import cm
+
+__all__ = [
+    "load_spec",
+    "get_jobs",
+    "get_aoi_model",
+    "get_model",
+    "run_sbae",
+    "run_job",
+    "run_batch",
+    "main",
+]
+
+DESIGN_SECTIONS = ["name", "sbae", "export"]
+"list: keys of a design that are not members of the Model"
+
+
+def load_spec(path):
+    """returns the job spec stored in a YAML or JSON file"""
+
+    path = Path(path)
+    text = path.read_text()
+
+    if path.suffix.lower() in [".yaml", ".yml"]:
+        try:
+            import yaml
+        except ImportError:
+            raise Exception(cm.batch.no_yaml)
+
+        return yaml.safe_load(text)
+
+    return json.loads(text)
+
+
+def get_jobs(spec):
+    """Returns the jobs of the spec: every design of every AOI.
+
+    Args:
+        spec (dict): job spec, see the module documentation
+
+    Returns:
+        list: name, AOI name and design (with the defaults applied) of each job
+    """
+
+    aois = spec.get("aois") or []
+    designs = spec.get("designs") or [{}]
+    if not aois:
+        raise Exception(cm.batch.no_aois)
+
+    jobs = []
+    for aoi in aois:
+        for i, design in enumerate(designs):
+            design = {**spec.get("defaults", {}), **design}
+            design_name = design.get("name", f"design{i}")
+            name = f"{aoi_name(aoi)}_{design_name}"
+            jobs.append((name, aoi_name(aoi), design))
+
+    return jobs
+
+
+def aoi_name(aoi):
+    """returns the name of an AOI entry, derived from its arguments if not given"""
+
+    return aoi.get("name") or "_".join(
+        f"{key}{value}" for key, value in aoi.items()
+    ).replace("/", "-")
+
+
+def get_aoi_model(aoi):
+    """Returns the AoiModel of an AOI entry. The AOI is loaded once and shared by all
+    the designs of the batch.
+
+    Args:
+        aoi (dict): name and AoiModel arguments (admin, asset, vector...) of the AOI
+    """
+
+    from sepal_ui.aoi import AoiModel
+
+    aoi_model = AoiModel(**{k: v for k, v in aoi.items() if k != "name"})
+    aoi_model.name = aoi_name(aoi)
+
+    return aoi_model
+
+
+def get_model(aoi_model, design):
+    """Returns a Model of the AOI with the members set in the design
+
+    Args:
+        aoi_model (sepal_ui.aoi.AoiModel): AOI of the job
+        design (dict): Model members and the sections of DESIGN_SECTIONS
+    """
+
+    from component.model import Model
+
+    model = Model(aoi_model)
+
+    # a new grid size resets the SBAE grid sizes, it's set first
+    members = sorted(design.items(), key=lambda item: item[0] != "grid_size")
+    for name, value in members:
+        if name in DESIGN_SECTIONS:
+            continue
+        if not model.has_trait(name):
+            raise Exception(cm.batch.unknown_member.format(name))
+        setattr(model, name, value)
+
+    return model
+
+
+def run_sbae(model, sbae, refresh=False):
+    """Computes the SBAE of the categorical image with the engine of the model.
+
+    Random designs are run with the seeds model.seed to model.seed + seeds - 1, a
+    systematic design only once. model.cat_image must be set (see run_job).
+
+    Args:
+        model (sbae.Model): model with the design
+        sbae (dict): sbae section of the design (seeds and processes)
+        refresh (bool): recompute the results already in the cache
+
+    Returns:
+        (list, dict, float): simulated areas of each run, real area by category and
+            scale of the reductions (None with the local engine)
+    """
+
+    n_seeds = 1 if model.method == "systematic" else int(sbae.get("seeds", 1))
+    seeds = [model.seed + i for i in range(n_seeds)]
+
+    if model.engine == "local":
+
+        from component.scripts import local_sbae
+
+        runs, real_area = local_sbae.simulate_seeds(
+            model,
+            model.cat_image,
+            seeds,
+            refresh=refresh,
+            processes=sbae.get("processes"),
+        )
+        return runs, real_area, None
+
+    from component.scripts import gee_sbae
+
+    scale = gee_sbae.get_reduction_scale(model, model.cat_image)
+    runs, real_area = gee_sbae.simulate_seeds(
+        model, model.cat_image, seeds, refresh=refresh, scale=scale
+    )
+
+    return runs, real_area, scale
+
+
+def get_cat_image(model, sbae):
+    """returns the categorical image of the sbae section for the engine of the model"""
+
+    if model.engine == "local":
+
+        from component.scripts.local_sbae import LocalRaster
+
+        return LocalRaster.from_geotiff(sbae["image"], sbae.get("band", 1))
+
+    import ee
+
+    return ee.Image(sbae["image"])
+
+
+def write_errors(runs, real_area, path):
+    """Writes the SBAE error tables as csv files next to path and returns them. The
+    errors of several runs are summarized by their mean, std and bounds."""
+
+    from component.scripts.processing import get_sbae_error, get_sbae_error_mc
+
+    if len(runs) > 1:
+        tables = get_sbae_error_mc(runs, real_area)
+    else:
+        tables = {"error": get_sbae_error(runs[0], real_area)}
+
+    files = []
+    for name, table in tables.items():
+        files.append(path.with_name(f"{path.name}_{name}.csv"))
+        table.to_csv(files[-1])
+
+    return [str(file) for file in files]
+
+
+def run_job(aoi_model, design, output, refresh=False):
+    """Creates the sample design of the AOI, computes its SBAE and exports its points.
+
+    Args:
+        aoi_model (sepal_ui.aoi.AoiModel): AOI of the job
+        design (dict): design of the job, see the module documentation
+        output (pathlib.Path): prefix of the files written by the job (SBAE errors
+            and sample points)
+        refresh (bool): recompute the SBAE results already in the cache
+
+    Returns:
+        dict: number of samples, SBAE files and scale, export message of the job
+    """
+
+    from component.scripts.scheduler import scheduler
+
+    model = get_model(aoi_model, design)
+    summary = {}
+
+    sbae = design.get("sbae")
+    if sbae:
+        model.cat_image = get_cat_image(model, sbae)
+
+    model.create_sample()
+    if model.nsamples is None:
+        model.nsamples = scheduler.get_info(model.points.size(), name="nsamples")
+    summary["nsamples"] = int(model.nsamples)
+
+    if sbae:
+        runs, real_area, scale = run_sbae(model, sbae, refresh)
+        summary["sbae_scale"] = scale
+        summary["sbae_files"] = write_errors(runs, real_area, output)
+
+    # the job name is unique, unlike scripts.get_filename that ignores some members
+    if design.get("export"):
+        model.export_method = design["export"]
+        filename = output.with_name(f"{output.name}.{model.export_method}")
+        summary["export"] = model.export_result(filename=filename)
+        if model.export_method not in ["asset", "gdrive"]:
+            summary["export_file"] = str(filename)
+
+    return summary
+
+
+def run_batch(spec, output=None, workers=None, refresh=False, on_job=None):
+    """Runs every job of the spec and writes the run summary.
+
+    The jobs run in a pool of workers threads, their EE requests go through the
+    shared scheduler and the SBAE results through the shared disk cache, so an
+    interrupted batch only recomputes what's missing when it's run again. Each AOI is
+    loaded once. A failing job is reported in the summary and doesn't stop the
+    others. The summary is written after every job.
+
+    Args:
+        spec (dict): job spec, see the module documentation
+        output (str, optional): folder of the results. Defaults to the output of
+            the spec or dir_.BATCH_DIR
+        workers (int, optional): number of jobs run at once. Defaults to the workers
+            of the spec or param.BATCH_WORKERS
+        refresh (bool): recompute the SBAE results already in the cache
+        on_job (callable, optional): called with the summary of each finished job
+
+    Returns:
+        dict: the run summary, also written in output/summary.json
+    """
+
+    output = Path(output or spec.get("output") or dir_.BATCH_DIR).expanduser()
+    output.mkdir(parents=True, exist_ok=True)
+    workers = workers or spec.get("workers") or param.BATCH_WORKERS
+
+    jobs = get_jobs(spec)
+    aois = {aoi_name(aoi): aoi for aoi in spec["aois"]}
+
+    summary = {
+        "started": datetime.datetime.now().isoformat(timespec="seconds"),
+        "output": str(output),
+        "workers": workers,
+        "jobs": [],
+    }
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def write_summary():
+        summary["duration_s"] = round(time.perf_counter() - start, 1)
+        summary["failed"] = sum(job["status"] == "failed" for job in summary["jobs"])
+        (output / "summary.json").write_text(json.dumps(summary, indent=2))
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+
+        # the AOIs are submitted first so they are loaded before any job waits for them
+        aoi_models = {
+            name: pool.submit(get_aoi_model, aoi) for name, aoi in aois.items()
+        }
+
+        def run(name, aoi, design):
+            job = {"name": name, "aoi": aoi, "design": design}
+            job_start = time.perf_counter()
+            try:
+                aoi_model = aoi_models[aoi].result()
+                job.update(run_job(aoi_model, design, output / name, refresh))
+                job["status"] = "done"
+            except Exception as e:
+                job.update(status="failed", error=str(e), trace=traceback.format_exc())
+            job["duration_s"] = round(time.perf_counter() - job_start, 1)
+
+            with lock:
+                summary["jobs"].append(job)
+                write_summary()
+
+            if on_job:
+                on_job(job)
+
+        futures = [pool.submit(run, *job) for job in jobs]
+        concurrent.futures.wait(futures)
+
+    write_summary()
+
+    return summary
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("spec", help="YAML or JSON job spec")
+    parser.add_argument("--output", help="folder of the results and the summary")
+    parser.add_argument("--workers", type=int, help="number of jobs run at once")
+    parser.add_argument(
+        "--refresh", action="store_true", help="ignore the cached SBAE results"
+    )
+    args = parser.parse_args(argv)
+
+    def report(job):
+        detail = job.get("error") or f"{job.get('nsamples')} samples"
+        print(f"{job['name']:<40} {job['status']:<7} {job['duration_s']:>8}s {detail}")
+
+    summary = run_batch(
+        load_spec(args.spec), args.output, args.workers, args.refresh, report
+    )
+    print(cm.batch.summary.format(Path(summary["output"], "summary.json")))
+
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import shapely
+
+import component.parameter.directory as dir_
+
+__all__ = [
+    "ResultCache",
+    "cache",
+    "aoi_key",
+    "image_key",
+    "design_key",
+    "sbae_keys",
+]
+
+
+class ResultCache:
+    """Content addressed cache of SBAE results stored as json files on disk.
+
+    Each entry is a file named after the hash of its key. The access time of the
+    entries is refreshed when they are read so the least recently used ones are
+    evicted first once the cache exceeds max_size.
+
+    Args:
+        folder (pathlib.Path): folder where the entries are stored
+        max_size (int): maximum size (bytes) of the cache folder
+    """
+
+    def __init__(self, folder=dir_.CACHE_DIR, max_size=50 * 2**20):
+
+        self.folder = folder
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.size = None
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        """returns the hash of the given json serializable parts"""
+
+        content = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def path(self, key):
+        return self.folder / f"{key}.json"
+
+    def get(self, key):
+        """returns the cached value or None if the key is not in the cache"""
+
+        path = self.path(key)
+
+        try:
+            value = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+        os.utime(path)
+
+        return value
+
+    def set(self, key, value):
+        """store the value and evict the least recently used entries if needed"""
+
+        path = self.path(key)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(value))
+
+        try:
+            previous = path.stat().st_size
+        except FileNotFoundError:
+            previous = 0
+
+        tmp.replace(path)
+
+        # the folder is only scanned when the running total exceeds the limit
+        with self.lock:
+            if self.size is not None:
+                self.size += path.stat().st_size - previous
+
+        if self.size is None or self.size > self.max_size:
+            self.evict()
+
+    def get_or_compute(self, key, function, *args, **kwargs):
+        """returns the cached value or computes it with function(*args, **kwargs)"""
+
+        value = self.get(key)
+
+        if value is None:
+            value = function(*args, **kwargs)
+            self.set(key, value)
+
+        return value
+
+    def lookup(self, real_key, sim_keys, refresh=False):
+        """Returns the cached real area (or None) and a dictionary with the cached
+        simulated areas found for the given {grid_size: key} dictionary"""
+
+        if refresh:
+            return None, {}
+
+        simulated_areas = {
+            grid_size: self.get(key) for grid_size, key in sim_keys.items()
+        }
+        simulated_areas = {k: v for k, v in simulated_areas.items() if v is not None}
+
+        return self.get(real_key), simulated_areas
+
+    def evict(self):
+        """remove the least recently used entries until the cache fits in max_size"""
+
+        with self.lock:
+
+            entries = []
+            for path in self.folder.glob("*.json"):
+                try:
+                    entries.append((path.stat(), path))
+                except FileNotFoundError:
+                    continue
+
+            total = sum(stat.st_size for stat, _ in entries)
+            for stat, path in sorted(entries, key=lambda e: e[0].st_mtime):
+                if total <= self.max_size:
+                    break
+                path.unlink(missing_ok=True)
+                total -= stat.st_size
+
+            self.size = total
+
+    def invalidate(self, key):
+        """remove a single entry"""
+
+        self.path(key).unlink(missing_ok=True)
+
+    def clear(self):
+        """remove every entry of the cache"""
+
+        [path.unlink(missing_ok=True) for path in self.folder.glob("*.json")]
+        self.size = 0
+
+
+def aoi_key(aoi, local=False):
+    """Returns a hashable description of a prepared AOI.
+
+    ee objects are identified by their serialized computation graph, which is built
+    on the client without any server call. It includes the projection and the
+    simplification of the AOI. The local engine identifies the AOI by the hash of its
+    shapely geometry, so it never needs an EE session.
+
+    Args:
+        aoi (PreparedAoi): AOI of the SBAE
+        local (bool): describe the shapely geometry instead of the ee.Geometry
+    """
+
+    if local:
+        return [hashlib.sha256(shapely.to_wkb(aoi.geometry)).hexdigest(), aoi.crs]
+
+    return aoi.ee_geometry.serialize()
+
+
+def image_key(image):
+    """returns a hashable description of a categorical image (ee.Image or LocalRaster)"""
+
+    if hasattr(image, "serialize"):
+        return image.serialize()
+
+    # local rasters are identified by their file and its modification time
+    source = getattr(image.array, "filename", None) or getattr(
+        image.array, "name", None
+    )
+    if source:
+        return [str(source), os.path.getmtime(source), getattr(image, "band", 1)]
+
+    # in-memory arrays by their content, hashed once per raster
+    if getattr(image, "content_hash", None) is None:
+        content = hashlib.sha256(str((image.array.dtype, image.array.shape)).encode())
+        content.update(memoryview(np.ascontiguousarray(image.array)).cast("B"))
+        image.content_hash = content.hexdigest()
+
+    return [image.content_hash, list(image.geotransform), str(image.crs)]
+
+
+def design_key(model, grid_size):
+    """returns the parameters of the model that change the simulated area"""
+
+    return {
+        "method": model.method,
+        "shape": model.shape,
+        "seed": model.seed if model.method != "systematic" else None,
+        "n_points": model.n_points,
+        "allocation": model.allocation if model.method == "strat_random" else None,
+        "out_crs": model.out_crs,
+        "point_sampling": model.point_sampling,
+        "grid_size": grid_size,
+    }
+
+
+def sbae_keys(model, image, grid_sizes, scale=None):
+    """Returns the cache key of the real area and the keys of the simulated area of
+    each grid size. The real area only depends on the unsimplified AOI, the image and
+    the scale of the reductions (None when the image is read at its native scale) so
+    it's shared by every design."""
+
+    local = not hasattr(image, "serialize")
+    aoi, img = aoi_key(model.prepared_aoi, local), image_key(image)
+    exact = aoi_key(model.prepared_aoi.exact, local)
+
+    real_key = ResultCache.key("real_area", exact, img, scale)
+    sim_keys = {
+        grid_size: ResultCache.key(
+            "simulated_area", aoi, img, scale, design_key(model, grid_size)
+        )
+        for grid_size in grid_sizes
+    }
+
+    return real_key, sim_keys
+
+
+cache = ResultCache()
+"ResultCache: cache shared by every SBAE computation of the app"
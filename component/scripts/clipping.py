@@ -0,0 +1,82 @@
+import numpy as np
+import shapely
+
+__all__ = ["INSIDE", "BOUNDARY", "OUTSIDE", "AoiIndex"]
+
+INSIDE, BOUNDARY, OUTSIDE = 0, 1, 2
+"int: status of a cell regarding the AOI"
+
+
+class AoiIndex:
+    """Spatial index of the AOI used to clip the cells and points in bulk.
+
+    The AOI is prepared for the exact point in polygon tests and its boundary is split
+    in segments stored in an STRtree. A cell whose centroid is farther from the
+    boundary than its circumradius is fully inside or fully outside the AOI, so only
+    the cells close to the boundary need an exact test, which keeps the clipping time
+    linear in the number of boundary cells.
+
+    Args:
+        aoi (shapely.Geometry): AOI projected in the crs of the cells and points
+    """
+
+    def __init__(self, aoi):
+
+        self.aoi = aoi
+        shapely.prepare(self.aoi)
+
+        coords, line = shapely.get_coordinates(shapely.boundary(aoi), return_index=True)
+        same_line = line[:-1] == line[1:]
+        segments = np.stack([coords[:-1], coords[1:]], axis=1)[same_line]
+
+        self.segments = shapely.linestrings(segments)
+        self.tree = shapely.STRtree(self.segments)
+
+    @property
+    def bounds(self):
+        return self.aoi.bounds
+
+    def contains(self, x, y):
+        """returns the mask of the points within the AOI"""
+
+        return shapely.contains_xy(self.aoi, x, y)
+
+    def near_boundary(self, x, y, distance):
+        """returns the mask of the points closer than distance to the AOI boundary"""
+
+        near = np.zeros(len(x), dtype=bool)
+        if len(x) and len(self.segments):
+            points = shapely.points(x, y)
+            hits = self.tree.query(points, predicate="dwithin", distance=distance)
+            near[hits[0]] = True
+
+        return near
+
+    def classify(self, x, y, radius):
+        """Returns the status (INSIDE, BOUNDARY or OUTSIDE) of the cells.
+
+        Args:
+            x (np.array): x coordinate of the centroid of each cell
+            y (np.array): y coordinate of the centroid of each cell
+            radius (float): circumradius of the cells (from their centroid)
+        """
+
+        status = np.full(len(x), BOUNDARY, dtype=np.int8)
+
+        far = ~self.near_boundary(x, y, radius)
+        status[far] = np.where(self.contains(x[far], y[far]), INSIDE, OUTSIDE)
+
+        return status
+
+    def clip(self, x, y, status=None):
+        """Returns the mask of the points within the AOI. When the status of the cell
+        of each point is given, only the points of boundary cells are tested."""
+
+        if status is None:
+            return self.contains(x, y)
+
+        keep = status == INSIDE
+        test = status == BOUNDARY
+        keep[test] = self.contains(x[test], y[test])
+
+        return keep
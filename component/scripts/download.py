@@ -0,0 +1,185 @@
+import collections
+import io
+import time
+
+import ee
+import numpy as np
+from sepal_ui.scripts.decorator import need_ee
+
+import component.parameter as param
+from component.scripts.scheduler import scheduler
+
+__all__ = [
+    "iter_features",
+    "index_boundaries",
+    "features_coordinates",
+    "iter_csv_chunks",
+    "wait_task",
+]
+
+
+@need_ee
+def iter_features(points, batch_size=5000):
+    """Yields the GeoJSON features of the collection by batches, in the order of their
+    system:index as iter_csv_chunks does, so the PLOTIDs don't depend on the download
+    path.
+
+    Pages are requested with a cursor on system:index (each page starts after the last
+    index received), so the server never has to materialize the prefix of the list as
+    toList(count, offset) does.
+
+    Args:
+        points (ee.FeatureCollection): collection to download
+        batch_size (int): maximum number of features of each request
+    """
+
+    cursor = None
+
+    while True:
+
+        page = points
+        if cursor is not None:
+            page = page.filter(ee.Filter.gt("system:index", cursor))
+
+        page = page.limit(batch_size, "system:index")
+        features = scheduler.get_info(page, name="features")["features"]
+
+        if features:
+            yield features
+
+        if len(features) < batch_size:
+            return
+
+        cursor = features[-1]["id"]
+
+
+def index_boundaries(points, step):
+    """Returns the system:index of every step-th feature of the collection, in the
+    order of system:index. The indices are sorted on the server and only the
+    boundaries are downloaded, with a single request.
+
+    Args:
+        points (ee.FeatureCollection): collection to split
+        step (int): number of features between two boundaries
+    """
+
+    ids = points.aggregate_array("system:index").sort()
+
+    return scheduler.get_info(ids.slice(0, ids.size(), step), name="boundaries")
+
+
+def features_coordinates(features):
+    """returns lon and lat float64 arrays of a list of GeoJSON point features"""
+
+    coords = np.array(
+        [feature["geometry"]["coordinates"] for feature in features], dtype="f8"
+    ).reshape(-1, 2)
+
+    return coords[:, 0], coords[:, 1]
+
+
+def fetch_csv(table):
+    """Download a lon/lat table as a single CSV file and return its lon and lat arrays.
+    Only the download URL request goes through the scheduler gate, the file itself is
+    downloaded without holding one of its slots."""
+
+    import requests
+
+    url = scheduler.call(
+        table.getDownloadURL, filetype="csv", selectors=["LON", "LAT"], name="csv"
+    )
+    scheduler.check()
+
+    response = requests.get(url, timeout=600)
+    response.raise_for_status()
+
+    # the header is the only line of an empty chunk
+    rows = response.text.split("\n", 1)[1:]
+    if not rows or not rows[0].strip():
+        return np.empty(0), np.empty(0)
+
+    coords = np.loadtxt(io.StringIO(rows[0]), delimiter=",", ndmin=2, dtype="f8")
+
+    return coords[:, 0], coords[:, 1]
+
+
+@need_ee
+def iter_csv_chunks(points, chunk_size=param.DOWNLOAD_CHUNK, group=None):
+    """Yields the lon/lat (EPSG:4326) arrays of the points by chunks, each one
+    downloaded as one CSV file instead of pages of GeoJSON features.
+
+    The collection is split in ranges of chunk_size consecutive system:index (see
+    index_boundaries), each chunk is sorted on it so the points come in the same order
+    as with iter_features. The chunks don't depend on each other and are always the
+    same. The coordinates are computed on the server and the geometries are dropped
+    before the download. The next param.DOWNLOAD_PREFETCH chunks are fetched in the
+    background while the current one is consumed, so only a few chunks are held in
+    memory, and they're yielded in order.
+
+    Args:
+        points (ee.FeatureCollection): collection to download
+        chunk_size (int): number of points of each chunk
+        group (str, optional): scheduler group of the downloads
+    """
+
+    # the first chunk starts at the first point and the last one ends at the last
+    bounds = [None] + index_boundaries(points, chunk_size)[1:] + [None]
+
+    def lon_lat(feature):
+        xy = feature.geometry().transform("EPSG:4326", 1e-3).coordinates()
+        return ee.Feature(None, {"LON": xy.get(0), "LAT": xy.get(1)})
+
+    def chunk(i):
+        start, end = bounds[i], bounds[i + 1]
+        table = points
+        if start is not None:
+            table = table.filter(ee.Filter.gte("system:index", start))
+        if end is not None:
+            table = table.filter(ee.Filter.lt("system:index", end))
+        return table.sort("system:index").map(lon_lat)
+
+    futures = collections.deque()
+    for i in range(len(bounds) - 1):
+
+        futures.append(scheduler.submit(fetch_csv, chunk(i), group=group))
+
+        if len(futures) > param.DOWNLOAD_PREFETCH:
+            yield futures.popleft().result()
+
+    while futures:
+        yield futures.popleft().result()
+
+
+def wait_task(task, on_status=None, interval=param.TASK_POLL, max_interval=60):
+    """Poll the status of an EE batch task with exponential backoff until it ends. The
+    wait stops with scheduler.Cancelled when the group of the calling task is
+    cancelled.
+
+    Args:
+        task (ee.batch.Task): started task
+        on_status (callable, optional): called with the status of every poll
+        interval (float): first delay (s) between two polls
+        max_interval (float): maximum delay (s) between two polls
+
+    Returns:
+        dict: final status of the completed task
+    """
+
+    while True:
+
+        status = scheduler.call(task.status, name="task_status")
+        if on_status:
+            on_status(status)
+
+        if status["state"] == "COMPLETED":
+            return status
+        elif status["state"] in ["FAILED", "CANCELLED"]:
+            raise Exception(status.get("error_message", status["state"]))
+
+        # sleep by steps of at most 1 s so a cancellation is seen quickly
+        deadline = time.monotonic() + interval
+        while time.monotonic() < deadline:
+            time.sleep(max(0, min(1, deadline - time.monotonic())))
+            scheduler.check()
+
+        interval = min(interval * 2, max_interval)
@@ -1,12 +1,14 @@
 import ee
+from sepal_ui.scripts.decorator import need_ee
 
+import component.parameter as param
 from component.message import cm
 
-ee.Initialize()
-
 
+@need_ee
 def get_grid(model, grid_size):
-    """Creates an squared grid in GEE. It can be as feature or as image (True).
+    """Creates the grid in GEE. Squares use coveringGrid, hexagons and triangles are
+    built on the server from the indices of their cells (see get_lattice_grid).
 
     Args:
         model (sbae.Model): the model will be used to get the default arguments that are
@@ -14,16 +16,83 @@ def get_grid(model, grid_size):
 
     """
 
-    aoi = model.aoi_model.feature_collection
-    if not aoi:
-        raise Exception(cm.error.no_aoi)
-
     if model.shape == "square":
-        geometry = ee.FeatureCollection(aoi).geometry().transform(model.out_crs, 100)
+        geometry = model.prepared_aoi.ee_geometry
         return ee.FeatureCollection(geometry.coveringGrid(model.out_crs, grid_size))
 
+    elif model.shape in ["hexagon", "triangle"]:
+        return get_lattice_grid(model, grid_size)
+
+
+@need_ee
+def get_lattice_grid(model, grid_size):
+    """Creates an hexagonal or triangular grid on the server, with the same cells and
+    order as local_sampling.get_grid. Only the lattice constants and the column range
+    of every row crossing the AOI are sent, so no cell geometry is uploaded. The
+    candidate cells are built by tiles of at most param.LATTICE_TILE cells instead of
+    one list covering the bounding box of the AOI.
+
+    Args:
+        model (sbae.Model): the model will be used to get the default arguments that are
+        used to create the grid such as: grid shape, out_crs and the AOI.
+        grid_size (int): size of the cells in meters
+    """
+
+    from component.scripts import local_sampling
+
+    dx, dy = local_sampling.cell_steps(model.shape, grid_size)
 
-def create_sample(model, grid):
+    # Vertices of a cell relative to the corner (ix * dx, iy * dy) of its indices.
+    # They only depend on the parity of the row (hexagon) or of the cell (triangle)
+    index_parity = [[0, 0], [0, 1]] if model.shape == "hexagon" else [[0, 0], [1, 0]]
+    offsets = [
+        (
+            local_sampling.cell_vertices(model.shape, [ix], [iy], grid_size)[0]
+            - [ix * dx, iy * dy]
+        ).tolist()
+        for ix, iy in index_parity
+    ]
+
+    # consecutive rows grouped by tiles of a bounded number of cells
+    ranges = local_sampling.row_ranges(
+        model.shape, grid_size, model.prepared_aoi.geometry
+    )
+    tiles, size = [[]], 0
+    for iy, first, last in ranges:
+        if tiles[-1] and size + last - first + 1 > param.LATTICE_TILE:
+            tiles.append([])
+            size = 0
+        tiles[-1].append([iy, first, last])
+        size += last - first + 1
+
+    offsets = ee.List(offsets)
+
+    def cell(ix, iy):
+        ix, iy = ee.Number(ix), ee.Number(iy)
+        parity = iy if model.shape == "hexagon" else ix.add(iy)
+        x0, y0 = ix.multiply(dx), iy.multiply(dy)
+        ring = ee.List(offsets.get(ee_parity(parity))).map(
+            lambda xy: ee.List([x0.add(ee.List(xy).get(0)), y0.add(ee.List(xy).get(1))])
+        )
+        return ee.Feature(ee.Geometry.Polygon(ee.List([ring]), model.out_crs, False))
+
+    def row_cells(row):
+        iy, first, last = [ee.List(row).get(i) for i in range(3)]
+        return ee.List.sequence(first, last).map(lambda ix: cell(ix, iy))
+
+    cells = ee.FeatureCollection(
+        [
+            ee.FeatureCollection(ee.List(tile).map(row_cells).flatten())
+            for tile in tiles
+            if tile
+        ]
+    ).flatten()
+
+    return cells.filterBounds(model.prepared_aoi.ee_geometry)
+
+
+@need_ee
+def create_sample(model, grid, grid_size=None):
     """Create sampling desing within the grid based on the strategy.
     This function can be called from the model (and then using the input grid_size parameter
     from the user) or called from the sbae calculation in which the grid_size will vary
@@ -32,26 +101,241 @@ def create_sample(model, grid):
     Args:
         model (sbae.Model): the model will be used to get the default arguments that are
         used to create the sample points such as: out_crs, seed, n_points and model.
+        grid (ee.FeatureCollection): grid in which the samples will be created
+        grid_size (int, optional): size of the cells of the grid, used by the random
+            and stratified designs. Defaults to model.grid_size
     """
 
     if model.method == "random":
+        return random_sample(model, grid, grid_size or model.grid_size)
+
+    elif model.method == "rand_syst":
+        return random_systematic_sample(model, grid)
+
+    elif model.method == "strat_random":
+        return stratified_sample(model, grid_size or model.grid_size)
 
-        def random_point(element):
-            """returns a random point within each grid cell with own seed"""
-            feature = ee.Feature(ee.List(element).get(0))
-            ft_seed = ee.Number(ee.List(element).get(1))
+    elif model.method == "systematic":
+        return grid.map(lambda ft: ft.centroid(1).transform(model.out_crs))
+
+
+def ee_parity(index):
+    """0 for the even and 1 for the odd (possibly negative) integers, as index % 2 in
+    numpy. ee.Number.mod keeps the sign of the dividend, so it gives -1 for the odd
+    negative indices (e.g. the southern rows in EPSG:3857)."""
+
+    return index.subtract(index.divide(2).floor().multiply(2))
+
+
+def ee_random_uniform(cell_seed, stream):
+    """ee.Number counterpart of local_sampling.random_uniform. All the intermediate
+    values are integers below 2^53 so the double arithmetic of EE is exact."""
+
+    from component.scripts.local_sampling import MINSTD_A, MINSTD_M
+
+    state = cell_seed.multiply(7919).add(stream * 104729)
+    state = state.mod(MINSTD_M - 1).add(1)
+
+    for _ in range(2):
+        state = state.multiply(MINSTD_A).mod(MINSTD_M)
+        state = state.multiply(state.mod(65521).add(1)).mod(MINSTD_M)
 
-            return ee.FeatureCollection.randomPoints(
-                feature.geometry().transform(model.out_crs, 1),
-                model.n_points,
-                ft_seed.multiply(model.seed),
+    return state.divide(MINSTD_M)
+
+
+def ee_cell_seed(ix, iy, seed):
+    """ee.Number counterpart of local_sampling.cell_seeds"""
+
+    from component.scripts.local_sampling import CELL_OFFSET, MINSTD_A, MINSTD_M
+
+    cell = (
+        ix.add(CELL_OFFSET)
+        .multiply(92821)
+        .add(iy.add(CELL_OFFSET).multiply(68917))
+        .mod(MINSTD_M - 1)
+    )
+
+    return cell.multiply(MINSTD_A).add(seed % MINSTD_M).mod(MINSTD_M - 1)
+
+
+@need_ee
+def random_sample(model, grid, grid_size):
+    """Draws model.n_points random points in every cell with a single map over the
+    grid. Each point is derived arithmetically from the indices of its cell (read from
+    its centroid) and the seed, as local_sampling.create_sample does, so the grid is
+    never materialized as a list and both engines draw the same points.
+
+    Args:
+        model (sbae.Model): model with the shape, seed, n_points and out_crs
+        grid (ee.FeatureCollection): grid in which the samples will be created
+        grid_size (int): size of the cells of the grid
+    """
+
+    from component.scripts import local_sampling
+
+    shape, n_points = model.shape, int(model.n_points)
+    dx, dy = local_sampling.cell_steps(shape, grid_size)
+    proj = ee.Projection(model.out_crs)
+
+    if shape != "square":
+        corners = local_sampling.centered_vertices(shape, grid_size)
+        corners = ee.List([vertices.tolist() for vertices in corners])
+
+    def random_points(ft):
+
+        xy = ee.List(ft.geometry().centroid(1, proj).coordinates())
+        cx, cy = ee.Number(xy.get(0)), ee.Number(xy.get(1))
+
+        if shape == "square":
+            ix, iy = cx.divide(dx).floor(), cy.divide(dy).floor()
+        elif shape == "hexagon":
+            iy = cy.divide(dy).round()
+            ix = cx.divide(dx).subtract(ee_parity(iy).multiply(0.5)).round()
+        elif shape == "triangle":
+            iy = cy.divide(dy).floor()
+            ix = cx.divide(dx).round().subtract(1)
+
+        cell_seed = ee_cell_seed(ix, iy, model.seed)
+
+        points = []
+        for point in range(n_points):
+
+            if shape == "square":
+                x = ix.add(ee_random_uniform(cell_seed, 2 * point)).multiply(dx)
+                y = iy.add(ee_random_uniform(cell_seed, 2 * point + 1)).multiply(dy)
+
+            else:
+                parity = ee_parity(iy if shape == "hexagon" else ix.add(iy))
+                ring = ee.List(corners.get(parity))
+                n_corners = 6 if shape == "hexagon" else 3
+
+                corner = ee_random_uniform(cell_seed, 3 * point).multiply(n_corners)
+                corner = corner.floor().int()
+                u = ee_random_uniform(cell_seed, 3 * point + 1)
+                v = ee_random_uniform(cell_seed, 3 * point + 2)
+                folded = u.add(v).gt(1)
+                u = ee.Number(ee.Algorithms.If(folded, ee.Number(1).subtract(u), u))
+                v = ee.Number(ee.Algorithms.If(folded, ee.Number(1).subtract(v), v))
+
+                a = ee.List(ring.get(corner))
+                b = ee.List(ring.get(corner.add(1).mod(n_corners)))
+                x = cx.add(u.multiply(a.get(0))).add(v.multiply(b.get(0)))
+                y = cy.add(u.multiply(a.get(1))).add(v.multiply(b.get(1)))
+
+            points.append(ee.Feature(ee.Geometry.Point([x, y], model.out_crs)))
+
+        return ee.FeatureCollection(points)
+
+    return grid.map(random_points).flatten()
+
+
+@need_ee
+def random_systematic_sample(model, grid):
+    """Moves the centroid of every cell by the same random offsets, drawn once for the
+    whole grid with the local generator. Offsets are in grid size units and every
+    shape has cells of grid_size² area, so the size of the cells is read from them.
+
+    Args:
+        model (sbae.Model): model with the shape, seed, n_points and out_crs
+        grid (ee.FeatureCollection): grid in which the samples will be created
+    """
+
+    from component.scripts import local_sampling
+
+    dx, dy = local_sampling.random_offsets(model.shape, model.seed, int(model.n_points))
+    offsets = ee.List([[x, y] for x, y in zip(dx.tolist(), dy.tolist())])
+    proj = ee.Projection(model.out_crs)
+
+    # height of the triangles rows, in grid size units
+    row_height = local_sampling.cell_steps(model.shape, 1)[1]
+
+    def shifted_points(ft):
+        geometry = ft.geometry()
+        size = geometry.area(1, proj).sqrt()
+        xy = ee.List(geometry.centroid(1, proj).transform(proj, 1).coordinates())
+        x, y = ee.Number(xy.get(0)), ee.Number(xy.get(1))
+
+        # down pointing triangles have their centroid in the upper half of the row
+        sign = ee.Number(1)
+        if model.shape == "triangle":
+            ymin = ee.Number(
+                ee.List(
+                    ee.List(geometry.bounds(1, proj).coordinates().get(0)).get(0)
+                ).get(1)
+            )
+            sign = (
+                ee.Number(y.subtract(ymin).lt(size.multiply(row_height / 2)))
+                .multiply(2)
+                .subtract(1)
             )
 
-        sequence = ee.List.sequence(1, grid.size())
-        grid_list = grid.toList(grid.size())
-        numbered_grid = grid_list.zip(sequence)
+        return ee.FeatureCollection(
+            offsets.map(
+                lambda offset: ee.Feature(
+                    ee.Geometry.Point(
+                        [
+                            x.add(sign.multiply(size).multiply(ee.List(offset).get(0))),
+                            y.add(sign.multiply(size).multiply(ee.List(offset).get(1))),
+                        ],
+                        model.out_crs,
+                    )
+                )
+            )
+        )
 
-        return ee.FeatureCollection(numbered_grid.map(random_point)).flatten()
+    return grid.map(shifted_points).flatten()
 
-    elif model.method == "systematic":
-        return grid.map(lambda ft: ft.centroid(1).transform(model.out_crs))
+
+@need_ee
+def stratified_sample(model, grid_size):
+    """Stratified random sample of the categorical image (model.cat_image), drawn by a
+    single stratifiedSample call. The number of points is the one of a random design
+    of the same grid size and it's allocated with model.allocation. Each point
+    carries the area it represents in its "weight" property (see
+    stratification.stratum_weights).
+
+    Args:
+        model (sbae.Model): model with the categorical image, seed, n_points and
+            allocation
+        grid_size (int): size of the cells of the equivalent random design
+    """
+
+    import json
+
+    from component.scripts import gee_sbae, stratification
+    from component.scripts.cache import cache, sbae_keys
+
+    if model.cat_image is None:
+        raise Exception(cm.error.non_cat_image)
+
+    # strata areas are the real areas of the SBAE, usually already cached
+    scale = gee_sbae.get_reduction_scale(model, model.cat_image)
+    real_key, _ = sbae_keys(model, model.cat_image, [], scale)
+    areas = cache.get_or_compute(
+        real_key, gee_sbae.get_area_by_category, model, model.cat_image, scale
+    )
+
+    n_points = stratification.get_n_points(model, sum(areas.values()), grid_size)
+    n_strata = stratification.allocate(areas, n_points, model.allocation)
+    weights = stratification.stratum_weights(areas, n_strata)
+    strata = ee.List([json.loads(key) for key in weights])
+    weights = ee.List(list(weights.values()))
+
+    return (
+        model.cat_image.select([0], ["stratum"])
+        .toInt()
+        .stratifiedSample(
+            numPoints=0,
+            classBand="stratum",
+            region=model.prepared_aoi.ee_geometry,
+            scale=model.cat_image.projection().nominalScale(),
+            seed=model.seed,
+            classValues=[json.loads(key) for key in n_strata],
+            classPoints=list(n_strata.values()),
+            geometries=True,
+            tileScale=4,
+        )
+        .map(
+            lambda ft: ft.set("weight", weights.get(strata.indexOf(ft.get("stratum"))))
+        )
+    )
@@ -1,11 +1,15 @@
 import concurrent.futures
 
 import ee
+from sepal_ui.scripts.decorator import need_ee
 
+import component.parameter as param
 from component.message import cm
 from component.scripts import gee_sampling
-
-ee.Initialize()
+from component.scripts.cache import ResultCache, cache, image_key, sbae_keys
+from component.scripts.processing import reduction_scale
+from component.scripts.scheduler import scheduler
+from component.scripts.scripts import ModelView, category_key, get_grid_sizes
 
 
 def unnest(group):
@@ -33,8 +37,68 @@ def get_total_area(ee_geometry):
     )
 
 
-def get_area_by_category(model, cat_image):
-    """returns real area by category"""
+@need_ee
+def get_native_scale(cat_image):
+    """returns the nominal scale (m) of the image, cached"""
+
+    key = ResultCache.key("native_scale", image_key(cat_image))
+    scale = cat_image.projection().nominalScale()
+
+    return cache.get_or_compute(key, scheduler.get_info, scale, name="native_scale")
+
+
+def get_reduction_scale(model, cat_image):
+    """Returns the scale (m) of every SBAE reduction of the image, so the real and the
+    simulated areas are computed at the same resolution. It's model.reduction_scale
+    when set, otherwise it's chosen from the native scale of the image and the AOI
+    area (see processing.reduction_scale), so the real area is shared by every design.
+    Only when the samples are rasterized (model.point_sampling unset) the scale is
+    kept below half the smallest grid size of the SBAE (refined grid sizes can be
+    finer than the user grid size), to keep the points in distinct pixels."""
+
+    if model.reduction_scale:
+        return int(model.reduction_scale)
+
+    return reduction_scale(
+        get_native_scale(cat_image),
+        model.prepared_aoi.exact.area,
+        None if model.point_sampling else min(get_grid_sizes(model)),
+        pyramid=model.pyramid,
+    )
+
+
+def area_column(model):
+    """returns the column of sample_points summed by class: the area represented by
+    the points of the weighted designs (strat_random) or the pixel area"""
+
+    return "weight" if model.method == "strat_random" else "area"
+
+
+def reduce_region_args(model, scale, aoi=None):
+    """returns the reduceRegion arguments shared by the SBAE reductions over the AOI
+    (defaults to model.prepared_aoi)"""
+
+    return {
+        "geometry": (aoi or model.prepared_aoi).ee_geometry,
+        "scale": scale,
+        "maxPixels": param.REDUCTION_PIXELS if model.best_effort else 1e14,
+        "bestEffort": model.best_effort,
+        "tileScale": model.tile_scale,
+    }
+
+
+@need_ee
+def get_area_by_category(model, cat_image, scale=None):
+    """returns real area by category, over the unsimplified AOI
+
+    Args:
+        model (sbae.model): sbae model with the AOI and the reduction settings
+        cat_image (ee.Image): categorical image
+        scale (float, optional): scale (m) of the reduction. Defaults to
+            get_reduction_scale(model, cat_image)
+    """
+
+    scale = scale or get_reduction_scale(model, cat_image)
 
     # Get area by category
     real_cat_area = ee.List(
@@ -42,26 +106,60 @@ def get_area_by_category(model, cat_image):
         .divide(1e4)
         .addBands(cat_image)
         .reduceRegion(
-            **{
-                "reducer": ee.Reducer.sum().group(1),
-                "geometry": model.aoi_model.feature_collection.geometry(),
-                "scale": 300,
-                "maxPixels": 1e14,
-            }
+            ee.Reducer.sum().group(1),
+            **reduce_region_args(model, scale, model.prepared_aoi.exact),
         )
         .get("groups")
     )
     real_cat_area = real_cat_area.map(unnest).unzip()
-    return ee.Dictionary.fromLists(
+    real_cat_area = ee.Dictionary.fromLists(
         ee.List(real_cat_area.get(0)).map(lambda x: ee.String.encodeJSON(x)),
         real_cat_area.get(1),
-    ).getInfo()
+    )
+
+    return scheduler.get_info(real_cat_area, name="real_area")
+
+
+@need_ee
+def sample_points(model, cat_image, samples, scale, properties=()):
+    """Reads the pixel area (ha, band "area") and the class (band "class") of the image
+    at the sample points located within the AOI. Only the pixels under the points are
+    computed, instead of every pixel of the AOI. The "weight" of the stratified points
+    is always copied.
+
+    Args:
+        model (sbae.model): sbae model with the AOI and the reduction settings
+        cat_image (ee.Image): categorical image
+        samples (ee.FeatureCollection): sample points
+        scale (float): scale (m) at which the image is read
+        properties (list): properties of the samples copied to the result
+    """
+
+    if model.method == "strat_random":
+        properties = [*properties, "weight"]
+
+    return (
+        ee.Image.pixelArea()
+        .divide(1e4)
+        .rename("area")
+        .addBands(cat_image.select([0], ["class"]))
+        .sampleRegions(
+            collection=samples.filterBounds(model.prepared_aoi.ee_geometry),
+            properties=list(properties),
+            scale=scale,
+            tileScale=model.tile_scale,
+        )
+    )
 
 
-def get_simulated_area(model, cat_image, grid_size):
+@need_ee
+def get_simulated_area(model, cat_image, grid_size, scale=None):
     """
 
-    Returns simulated area by category using the given grid size
+    Returns simulated area by category using the given grid size. With
+    model.point_sampling (and always for the weighted stratified points), the image is
+    only read at the sample points, otherwise the samples are rasterized and the area
+    is reduced over the whole AOI.
 
     Args:
         model (sbae.model): sbae model to get the default values (user inputs) and pass
@@ -69,19 +167,29 @@ def get_simulated_area(model, cat_image, grid_size):
         cat_image (ee.Image): categorical image to perform simulated based area
             estimation.
         grid_size (int): grid size to create the sampling design
+        scale (float, optional): scale (m) of the reduction. Defaults to
+            get_reduction_scale(model, cat_image)
 
     """
-    print(f"Processing with {grid_size}")
-
-    proj = ee.Projection("EPSG:3857").atScale(grid_size)
     grid = gee_sampling.get_grid(model, grid_size)
-    pixel_size = cat_image.projection().nominalScale()
+    pixel_size = scale or get_reduction_scale(model, cat_image)
+
+    sample_img = gee_sampling.create_sample(model, grid, grid_size)
+
+    if model.point_sampling or model.method == "strat_random":
+        groups = (
+            sample_points(model, cat_image, sample_img, pixel_size)
+            .reduceColumns(ee.Reducer.sum().group(1), [area_column(model), "class"])
+            .get("groups")
+        )
+        groups = scheduler.get_info(groups, name="simulated_area")
+
+        return {category_key(group["group"]): group["sum"] for group in groups}
 
-    sample_img = gee_sampling.create_sample(model, grid)
     sample_img = (
         sample_img.reduceToImage(["system:index"], ee.Reducer.count())
         .selfMask()
-        .reproject(proj.atScale(pixel_size))
+        .reproject(ee.Projection("EPSG:3857").atScale(pixel_size))
     )
 
     res = (
@@ -91,12 +199,7 @@ def get_simulated_area(model, cat_image, grid_size):
         .addBands(sample_img)
         .updateMask(sample_img.mask())
         .reduceRegion(
-            **{
-                "reducer": ee.Reducer.sum().group(1).group(2),
-                "geometry": model.aoi_model.feature_collection.geometry(),
-                "scale": pixel_size,
-                "maxPixels": 1e14,
-            }
+            ee.Reducer.sum().group(1).group(2), **reduce_region_args(model, pixel_size)
         )
         .get("groups")
     )
@@ -105,38 +208,229 @@ def get_simulated_area(model, cat_image, grid_size):
     # Get the simulated area by category using the input grid size.
     sample_cat_area = ee.Dictionary.fromLists(
         ee.List(res.get(0)).map(lambda x: ee.String.encodeJSON(x)), res.get(1)
-    ).getInfo()
+    )
+
+    return scheduler.get_info(sample_cat_area, name="simulated_area")
+
+
+@need_ee
+def get_simulated_areas(model, cat_image, grid_sizes, scale=None):
+    """
+
+    Returns simulated area by category for all the grid sizes with a single grouped
+    reduction. Each sample is tagged with one bit per grid size. With
+    model.point_sampling the image is read at the points and their area is grouped by
+    class and tag, otherwise the samples are rasterized with a bitwise-or and the area
+    is grouped by class and tag, so every pixel of the AOI is read only once.
+
+    Args:
+        model (sbae.model): sbae model to get the default values (user inputs) and pass
+            to the sampling creation
+        cat_image (ee.Image): categorical image to perform simulated based area
+            estimation.
+        grid_sizes (list): grid sizes to create the sampling designs
+        scale (float, optional): scale (m) of the reduction. Defaults to
+            get_reduction_scale(model, cat_image)
+
+    """
+    pixel_size = scale or get_reduction_scale(model, cat_image)
+
+    samples = ee.FeatureCollection(
+        [
+            gee_sampling.create_sample(
+                model, gee_sampling.get_grid(model, grid_size), grid_size
+            ).map(lambda ft, bit=2**i: ft.set("grid", bit))
+            for i, grid_size in enumerate(grid_sizes)
+        ]
+    ).flatten()
+
+    if model.point_sampling or model.method == "strat_random":
+        groups = (
+            sample_points(model, cat_image, samples, pixel_size, ["grid"])
+            .reduceColumns(
+                ee.Reducer.sum().group(1).group(2),
+                [area_column(model), "class", "grid"],
+            )
+            .get("groups")
+        )
+
+    else:
+        sample_img = (
+            samples.reduceToImage(["grid"], ee.Reducer.bitwiseOr())
+            .selfMask()
+            .reproject(ee.Projection("EPSG:3857").atScale(pixel_size))
+        )
+
+        groups = (
+            ee.Image.pixelArea()
+            .divide(1e4)
+            .addBands(cat_image)
+            .addBands(sample_img)
+            .updateMask(sample_img.mask())
+            .reduceRegion(
+                ee.Reducer.sum().group(1).group(2),
+                **reduce_region_args(model, pixel_size),
+            )
+            .get("groups")
+        )
+
+    groups = scheduler.get_info(groups, name="simulated_areas")
 
-    return sample_cat_area
+    # Expand the tags on the client side: a pixel (or point) counts for every grid
+    # size whose bit is set in its tag
+    simulated_areas = {grid_size: {} for grid_size in grid_sizes}
+    for tag_group in groups:
+        for i, grid_size in enumerate(grid_sizes):
+            if not int(tag_group["group"]) & 2**i:
+                continue
+            areas = simulated_areas[grid_size]
+            for cat_group in tag_group["groups"]:
+                key = category_key(cat_group["group"])
+                areas[key] = areas.get(key, 0) + cat_group["sum"]
 
+    return simulated_areas
 
-def simulate_areas(model, cat_image):
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=9) as executor:
+@need_ee
+def simulate_areas(
+    model,
+    cat_image,
+    single_pass=False,
+    refresh=False,
+    grid_sizes=None,
+    group=None,
+    on_progress=None,
+    scale=None,
+):
+    """Returns the simulated area by category for every grid size of the SBAE curve and
+    the real area by category. Results already stored in the cache are not recomputed.
+    When model.shard_size is set, the AOI is split in shards computed in parallel (see
+    sharding.simulate_areas_sharded).
 
-        grid_sizes = [model.grid_size * mult for mult in [1, 2, 3, 4, 5, 10, 20, 50]]
+    Args:
+        model (sbae.model): sbae model with the user inputs
+        cat_image (ee.Image): categorical image
+        single_pass (bool): compute all the grid sizes with one grouped reduction
+            instead of one reduction per grid size.
+        refresh (bool): ignore the cached results and compute them again
+        grid_sizes (list, optional): grid sizes to simulate. Defaults to
+            scripts.get_grid_sizes(model)
+        group (str, optional): scheduler group of the requests, used to cancel them.
+            Defaults to the group of the calling task.
+        on_progress (callable, optional): called with the (partial) simulated areas
+            and real area (None until computed) every time a request is completed.
+        scale (float, optional): scale (m) of all the reductions. Defaults to
+            get_reduction_scale(model, cat_image)
+    """
+
+    # the strata allocation of strat_random depends on the whole AOI
+    if model.shard_size and model.method != "strat_random":
+
+        from component.scripts.sharding import simulate_areas_sharded
+
+        return simulate_areas_sharded(
+            model, cat_image, refresh, grid_sizes, group, on_progress, scale
+        )
 
+    grid_sizes = grid_sizes or get_grid_sizes(model)
+    scale = scale or get_reduction_scale(model, cat_image)
+    real_key, sim_keys = sbae_keys(model, cat_image, grid_sizes, scale)
+
+    real_area, simulated_areas = cache.lookup(real_key, sim_keys, refresh)
+    missing = [gs for gs in grid_sizes if gs not in simulated_areas]
+
+    # The requests are sent by the shared scheduler, that caps the number of
+    # concurrent EE requests of the whole app and retries the ones hitting a quota.
+    if single_pass and missing:
         futures = {
-            executor.submit(get_simulated_area, model, cat_image, grid_size): grid_size
-            for grid_size in grid_sizes
+            scheduler.submit(
+                get_simulated_areas, model, cat_image, missing, scale, group=group
+            ): "single_pass"
         }
-
-        real_area = {
-            executor.submit(get_area_by_category, model, cat_image): "real_area"
+    else:
+        futures = {
+            scheduler.submit(
+                get_simulated_area, model, cat_image, grid_size, scale, group=group
+            ): grid_size
+            for grid_size in missing
         }
 
-        futures.update(real_area)
+    if real_area is None:
+        futures[
+            scheduler.submit(get_area_by_category, model, cat_image, scale, group=group)
+        ] = "real_area"
+
+    # As we don't know which task was completed first, we have to save them in a
+    # key(grid_size) : value (future.result()) format
+    for future in concurrent.futures.as_completed(futures):
 
-        simulated_areas = {}
-        # As we don't know which task was completed first, we have to save them in a
-        # key(grid_size) : value (future.result()) format
-        for future in concurrent.futures.as_completed(futures):
+        future_name = futures[future]
 
-            future_name = futures[future]
+        if future_name == "real_area":
+            real_area = future.result()
+            cache.set(real_key, real_area)
+
+        else:
+            results = (
+                future.result()
+                if future_name == "single_pass"
+                else {future_name: future.result()}
+            )
+            for grid_size, result in results.items():
+                simulated_areas[grid_size] = result
+                cache.set(sim_keys[grid_size], result)
+
+        if on_progress:
+            on_progress(simulated_areas, real_area)
+
+    return (simulated_areas, real_area)
+
+
+def simulate_seeds(
+    model,
+    cat_image,
+    seeds,
+    single_pass=True,
+    refresh=False,
+    grid_sizes=None,
+    group=None,
+    on_progress=None,
+    scale=None,
+):
+    """Run simulate_areas once per seed, to get the distribution of the SBAE error of
+    random designs.
+
+    Args:
+        model (sbae.model): sbae model with the user inputs
+        cat_image (ee.Image): categorical image
+        seeds (list): seeds of the runs
+        single_pass (bool): see simulate_areas
+        refresh (bool): see simulate_areas
+        grid_sizes (list, optional): see simulate_areas
+        group (str, optional): see simulate_areas
+        on_progress (callable, optional): called with the runs done so far and the
+            real area after each seed.
+        scale (float, optional): see simulate_areas
+
+    Returns:
+        (list, dict): simulated areas of each run and the real area by category, as
+            consumed by processing.get_sbae_error_mc.
+    """
+
+    runs = []
+    for seed in seeds:
+        simulated_areas, real_area = simulate_areas(
+            ModelView(model, seed=seed),
+            cat_image,
+            single_pass,
+            refresh,
+            grid_sizes,
+            group,
+            scale=scale,
+        )
+        runs.append(simulated_areas)
 
-            if future_name != "real_area":
-                simulated_areas[future_name] = future.result()
-            else:
-                real_area = future.result()
+        if on_progress:
+            on_progress(runs, real_area)
 
-        return (simulated_areas, real_area)
+    return (runs, real_area)
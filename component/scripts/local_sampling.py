@@ -0,0 +1,591 @@
+import numpy as np
+import shapely
+from sepal_ui.scripts.decorator import need_ee
+
+import component.parameter as param
+from component.message import cm
+from component.scripts import clipping
+
+MINSTD_A = 16807
+"int: multiplier of the Park-Miller minimal standard generator"
+MINSTD_M = 2147483647
+"int: modulus (2^31 - 1) of the Park-Miller minimal standard generator"
+CELL_OFFSET = 2**25
+"int: added to the cell indices to keep them positive, any 1 m grid of a projected crs fits"
+
+
+def get_aoi_geometry(model):
+    """returns the prepared AOI of the model as a shapely geometry projected in
+    model.out_crs"""
+
+    return model.prepared_aoi.geometry
+
+
+def cell_seeds(ix, iy, seed):
+    """Integer seed of each (ix, iy) cell for the given design seed.
+
+    The seed only depends on the indices of the cell, not on its position within the
+    grid, so it can be computed for every feature of a grid independently (e.g. in a
+    ee.FeatureCollection.map). Intermediate products stay below 2^53.
+
+    Args:
+        ix (np.array): column index of each cell
+        iy (np.array): row index of each cell
+        seed (int): seed of the design
+    """
+
+    ix = np.asarray(ix, dtype=np.int64) + CELL_OFFSET
+    iy = np.asarray(iy, dtype=np.int64) + CELL_OFFSET
+
+    cell = np.mod(ix * 92821 + iy * 68917, MINSTD_M - 1)
+    return np.mod(cell * MINSTD_A + seed % MINSTD_M, MINSTD_M - 1)
+
+
+def random_uniform(cell_seed, stream):
+    """Counter based uniform numbers in [0, 1).
+
+    Every number only depends on the cell seed and on the stream number (i.e. the
+    point and the coordinate that is drawn), so the same sample is obtained no matter
+    how many cells are computed at once. All the intermediate products stay below 2^53
+    so the same arithmetic can be reproduced exactly with ee.Number.
+
+    Args:
+        cell_seed (np.array): integer seed (< 2^31) of each cell, see cell_seeds
+        stream (int, np.array): independent stream number for each drawn value
+    """
+
+    state = (
+        np.asarray(cell_seed, dtype=np.int64) * 7919
+        + np.asarray(stream, dtype=np.int64) * 104729
+    )
+    state = np.mod(state, MINSTD_M - 1) + 1
+
+    for _ in range(2):
+        state = np.mod(state * MINSTD_A, MINSTD_M)
+        state = np.mod(state * (np.mod(state, 65521) + 1), MINSTD_M)
+
+    return state / MINSTD_M
+
+
+def cell_steps(shape, grid_size):
+    """Returns the column and row steps of the lattice of cells. Triangles and hexagons
+    have the same area as the squares of the same grid size (grid_size²), so the
+    designs of every shape have the same density.
+
+    Args:
+        shape (str): square, triangle or hexagon
+        grid_size (int): size of the cells in meters
+    """
+
+    if shape == "square":
+        return grid_size, grid_size
+
+    elif shape == "hexagon":
+        # pointy top hexagons, odd rows are shifted by half a cell
+        side = grid_size * np.sqrt(2 / (3 * np.sqrt(3)))
+        return np.sqrt(3) * side, 1.5 * side
+
+    elif shape == "triangle":
+        # alternately pointing up and down triangles, half a side apart
+        side = grid_size * np.sqrt(4 / np.sqrt(3))
+        return side / 2, np.sqrt(3) / 2 * side
+
+    raise ValueError(f"Unknown grid shape: {shape}")
+
+
+class LocalGrid:
+    """Covering grid of the AOI stored as the integer indices of its cells.
+
+    The geometry of every cell is derived from its indices, so no per-cell object is
+    created until the cells are converted to polygons. For squares, cell (ix, iy) spans
+    [ix * grid_size, (ix + 1) * grid_size) in the projected crs, which is the same
+    alignment used by ee.Geometry.coveringGrid. Hexagons and triangles have the same
+    area as the squares. The random design seeds every cell from its indices (see
+    cell_seeds), so the same points are drawn on GEE.
+
+    Args:
+        ix (np.array): column index of each cell
+        iy (np.array): row index of each cell
+        grid_size (int): size of the cells in meters
+        crs (str): projected crs of the grid
+        shape (str): square, triangle or hexagon
+        status (np.array, optional): status of each cell regarding the AOI, either
+            clipping.INSIDE or clipping.BOUNDARY
+    """
+
+    def __init__(self, ix, iy, grid_size, crs, shape="square", status=None):
+
+        self.ix = ix
+        self.iy = iy
+        self.grid_size = grid_size
+        self.crs = crs
+        self.shape = shape
+        self.status = status
+
+    def __len__(self):
+        return len(self.ix)
+
+    def centroids(self):
+        """returns x and y arrays with the center of each cell"""
+
+        return cell_centroids(self.shape, self.ix, self.iy, self.grid_size)
+
+    def vertices(self):
+        """returns the (cells x corners x 2) array of the vertices of each cell"""
+
+        return cell_vertices(self.shape, self.ix, self.iy, self.grid_size)
+
+    def bounds(self):
+        """returns xmin, ymin, xmax, ymax arrays of each cell"""
+
+        vertices = self.vertices()
+        xmin, ymin = vertices.min(axis=1).T
+        xmax, ymax = vertices.max(axis=1).T
+
+        return xmin, ymin, xmax, ymax
+
+    def polygons(self):
+        """returns the cells as an array of shapely polygons"""
+
+        return shapely.polygons(self.vertices())
+
+    @need_ee
+    def to_feature_collection(self):
+        """upload the grid as an ee.FeatureCollection. Only needed to display it"""
+
+        import ee
+
+        if self.shape == "square":
+            return ee.FeatureCollection(
+                [
+                    ee.Feature(ee.Geometry.Rectangle(list(box), self.crs, False))
+                    for box in zip(*[b.tolist() for b in self.bounds()])
+                ]
+            )
+
+        return ee.FeatureCollection(
+            [
+                ee.Feature(ee.Geometry.Polygon([ring], self.crs, False))
+                for ring in self.vertices().tolist()
+            ]
+        )
+
+
+def centered_vertices(shape, grid_size):
+    """returns the vertices of the cells relative to their centroid, for both parities
+    of the lattice (even and odd rows of hexagons, up and down triangles)"""
+
+    parities = [[0, 0], [0, 1]] if shape == "hexagon" else [[0, 0], [1, 0]]
+
+    return [
+        cell_vertices(shape, [ix], [iy], grid_size)[0]
+        - np.stack(cell_centroids(shape, [ix], [iy], grid_size), -1)
+        for ix, iy in parities
+    ]
+
+
+def cell_radius(shape, grid_size):
+    """returns the largest distance between the centroid and the vertices of a cell"""
+
+    return max(
+        np.hypot(*vertices.T).max() for vertices in centered_vertices(shape, grid_size)
+    )
+
+
+def cell_centroids(shape, ix, iy, grid_size):
+    """returns the x and y arrays of the centroid of the (ix, iy) cells"""
+
+    dx, dy = cell_steps(shape, grid_size)
+    ix, iy = np.asarray(ix), np.asarray(iy)
+
+    if shape == "square":
+        return (ix + 0.5) * dx, (iy + 0.5) * dy
+
+    elif shape == "hexagon":
+        return (ix + 0.5 * (iy % 2)) * dx, iy * dy
+
+    elif shape == "triangle":
+        up = (ix + iy) % 2 == 0
+        return (ix + 1) * dx, (iy + np.where(up, 1 / 3, 2 / 3)) * dy
+
+
+def cell_vertices(shape, ix, iy, grid_size):
+    """returns the (cells x corners x 2) array of the vertices of the (ix, iy) cells,
+    counterclockwise"""
+
+    dx, dy = cell_steps(shape, grid_size)
+    x, y = np.asarray(ix, dtype="f8"), np.asarray(iy, dtype="f8")
+
+    if shape == "square":
+        corners = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+        x, y = x * dx, y * dy
+        scale = np.array([dx, dy])
+
+    elif shape == "hexagon":
+        angles = np.radians(30 + 60 * np.arange(6))
+        corners = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        x, y = cell_centroids(shape, x, y, grid_size)
+        scale = dy / 1.5
+
+    elif shape == "triangle":
+        up = ((x + y) % 2 == 0)[:, None, None]
+        corners = np.where(
+            up,
+            np.array([[0, 0], [2, 0], [1, 1]]),
+            np.array([[0, 1], [1, 0], [2, 1]]),
+        )
+        x, y = x * dx, y * dy
+        scale = np.array([dx, dy])
+
+    return np.stack([x, y], axis=-1)[:, None, :] + corners * scale
+
+
+def row_ranges(shape, grid_size, aoi):
+    """Returns the [iy, first, last] column range of every row of the lattice whose
+    cells can be kept by get_grid, measured on the part of the AOI within the
+    vertical extent of the row. As in get_grid, the cells touching the AOI are
+    included and the ranges are clipped to its candidate indices. The cells out of
+    the ranges are never kept, the cells of the ranges may not be (in the
+    concavities and holes of the AOI, and between the hexagons and triangles of a
+    row).
+
+    Args:
+        shape (str): square, triangle or hexagon
+        grid_size (int): size of the cells in meters
+        aoi (shapely.Geometry): AOI projected in the crs of the lattice
+    """
+
+    dx, dy = cell_steps(shape, grid_size)
+
+    # extent of the cells relative to the corner (ix * dx, iy * dy) of their indices
+    parities = [[0, 0], [0, 1]] if shape == "hexagon" else [[0, 0], [1, 0]]
+    offsets = np.concatenate(
+        [
+            cell_vertices(shape, [ix], [iy], grid_size)[0] - [ix * dx, iy * dy]
+            for ix, iy in parities
+        ]
+    )
+    (oxmin, oymin), (oxmax, oymax) = offsets.min(0), offsets.max(0)
+
+    # candidate indices of get_grid, with the same margin
+    margin = 0 if shape == "square" else 1
+    xmin, ymin, xmax, ymax = aoi.bounds
+    min_col, max_col = np.floor(xmin / dx) - margin, np.ceil(xmax / dx) + margin - 1
+    min_row, max_row = np.floor(ymin / dy) - margin, np.ceil(ymax / dy) + margin - 1
+
+    # indices of the cells whose extent touches the [low, high] range
+    def index_range(low, high, omin, omax, step, lowest, highest):
+        first = max(np.ceil((low - omax) / step), lowest)
+        last = min(np.floor((high - omin) / step), highest)
+        return int(first), int(last)
+
+    first_row, last_row = index_range(ymin, ymax, oymin, oymax, dy, min_row, max_row)
+
+    ranges = []
+    for iy in range(first_row, last_row + 1):
+
+        strip = shapely.box(xmin, iy * dy + oymin, xmax, iy * dy + oymax)
+        band = shapely.intersection(aoi, strip)
+        if band.is_empty:
+            continue
+
+        bxmin, _, bxmax, _ = band.bounds
+        first, last = index_range(bxmin, bxmax, oxmin, oxmax, dx, min_col, max_col)
+        if first <= last:
+            ranges.append([iy, first, last])
+
+    return ranges
+
+
+class LocalSample:
+    """Sample points stored as flat coordinate arrays in the projected crs.
+
+    Args:
+        x (np.array): x coordinate of each point
+        y (np.array): y coordinate of each point
+        cell (np.array): position of the cell (within the grid) containing the point,
+            -1 for the designs that don't use the grid
+        crs (str): projected crs of the coordinates
+        weight (np.array, optional): area represented by each point, for the designs
+            whose points don't have the same inclusion probability (strat_random)
+    """
+
+    def __init__(self, x, y, cell, crs, weight=None):
+
+        self.x = x
+        self.y = y
+        self.cell = cell
+        self.crs = crs
+        self.weight = weight
+
+    def __len__(self):
+        return len(self.x)
+
+    def subset(self, mask):
+        """returns a LocalSample with the points selected by the mask"""
+
+        weight = None if self.weight is None else self.weight[mask]
+
+        return LocalSample(
+            self.x[mask], self.y[mask], self.cell[mask], self.crs, weight
+        )
+
+    @need_ee
+    def to_feature_collection(self, batch_size=param.UPLOAD_BATCH):
+        """Upload the points as an ee.FeatureCollection. The coordinates (rounded to
+        the cm) are sent by batches of batch_size points, each one as a single
+        MultiPoint literal that is split into point features on the server, instead
+        of one Feature object per point.
+
+        Args:
+            batch_size (int): number of points of each uploaded geometry
+        """
+
+        import ee
+
+        def features(geometry):
+            return ee.FeatureCollection(
+                geometry.geometries().map(lambda point: ee.Feature(point))
+            )
+
+        xy = np.round(np.stack([self.x, self.y], axis=-1), 2)
+        batches = [
+            features(ee.Geometry.MultiPoint(xy[i : i + batch_size].tolist(), self.crs))
+            for i in range(0, len(xy), batch_size)
+        ]
+
+        return ee.FeatureCollection(batches).flatten()
+
+
+def get_aoi_index(model, aoi=None):
+    """returns the clipping.AoiIndex of the AOI
+
+    Args:
+        model (sbae.Model): model with the AOI and out_crs
+        aoi (shapely.Geometry, clipping.AoiIndex, optional): AOI projected in
+            model.out_crs. Computed from the model when not given.
+    """
+
+    if isinstance(aoi, clipping.AoiIndex):
+        return aoi
+    elif aoi is None:
+        return model.prepared_aoi.index
+
+    return clipping.AoiIndex(aoi)
+
+
+def get_grid(model, grid_size, aoi=None):
+    """Creates the covering grid of the AOI as a LocalGrid.
+
+    The candidate cells are classified from their centroid: cells far enough from the
+    AOI boundary are kept (inside) or dropped (outside) without building them, only the
+    boundary cells are converted to polygons and tested against the AOI.
+
+    Args:
+        model (sbae.Model): the model will be used to get the default arguments that are
+            used to create the grid such as: grid shape and out_crs.
+        grid_size (int): size of the cells in meters
+        aoi (shapely.Geometry, clipping.AoiIndex, optional): AOI projected in
+            model.out_crs. Computed from the model when not given.
+    """
+
+    aoi = get_aoi_index(model, aoi)
+    dx, dy = cell_steps(model.shape, grid_size)
+    radius = cell_radius(model.shape, grid_size)
+
+    # candidate cells: every index range touching the AOI bounds, with a margin for
+    # the hexagons and triangles overlapping their neighbouring columns and rows
+    margin = 0 if model.shape == "square" else 1
+    xmin, ymin, xmax, ymax = aoi.bounds
+    cols = np.arange(
+        np.floor(xmin / dx) - margin, np.ceil(xmax / dx) + margin, dtype=np.int64
+    )
+    rows = np.arange(
+        np.floor(ymin / dy) - margin, np.ceil(ymax / dy) + margin, dtype=np.int64
+    )
+
+    # Filter the candidate cells row by row to keep memory bounded by the width of
+    # the AOI instead of its whole bounding box
+    ix, iy, status = [], [], []
+    for row in rows:
+        row_iy = np.full(len(cols), row, dtype=np.int64)
+        row_status = aoi.classify(
+            *cell_centroids(model.shape, cols, row_iy, grid_size), radius
+        )
+
+        boundary = np.flatnonzero(row_status == clipping.BOUNDARY)
+        cells = shapely.polygons(
+            cell_vertices(model.shape, cols[boundary], row_iy[boundary], grid_size)
+        )
+        row_status[boundary[~shapely.intersects(aoi.aoi, cells)]] = clipping.OUTSIDE
+
+        kept = row_status != clipping.OUTSIDE
+        ix.append(cols[kept])
+        iy.append(row_iy[kept])
+        status.append(row_status[kept])
+
+    ix = np.concatenate(ix) if ix else np.empty(0, dtype=np.int64)
+    iy = np.concatenate(iy) if iy else np.empty(0, dtype=np.int64)
+    status = np.concatenate(status) if status else np.empty(0, dtype=np.int8)
+
+    return LocalGrid(ix, iy, grid_size, model.out_crs, model.shape, status)
+
+
+def clip_sample(sample, grid, aoi):
+    """Drops the points of the sample falling outside the AOI. Points of the cells
+    fully inside the AOI are kept without test, only the points of the boundary cells
+    (or every point for the designs that don't use the grid) are tested.
+
+    Args:
+        sample (LocalSample): sample created within the grid
+        grid (LocalGrid): grid of the sample, as returned by get_grid
+        aoi (clipping.AoiIndex): index of the AOI projected in the sample crs
+    """
+
+    status = None
+    if grid.status is not None and len(sample) and sample.cell.min() >= 0:
+        status = grid.status[sample.cell]
+
+    return sample.subset(aoi.clip(sample.x, sample.y, status))
+
+
+def estimate_sample_size(model):
+    """Returns the expected number of points of the design without creating it.
+
+    When the sample is clipped to the AOI (and for the stratified design), it's the
+    density of the design (n_points per grid_size²) times the area of the AOI.
+    Otherwise it's the number of candidate cells of the rows crossing the AOI (see
+    row_ranges) times n_points, so the grid is never built. It's exact for the squares
+    of a convex AOI (including, as get_grid, the cells touching it at a corner) and
+    a few percents above the size of the grid otherwise.
+
+    Args:
+        model (sbae.Model): model with the design parameters and the AOI
+    """
+
+    n_points = 1 if model.method == "systematic" else int(model.n_points)
+
+    if model.clip or model.method == "strat_random":
+        density = n_points / model.grid_size**2
+        return int(round(model.prepared_aoi.area * 1e4 * density))
+
+    ranges = row_ranges(model.shape, model.grid_size, model.prepared_aoi.geometry)
+
+    return sum(last - first + 1 for _, first, last in ranges) * n_points
+
+
+def random_points(shape, ix, iy, grid_size, cell_seed, point):
+    """Returns x and y arrays with one uniform random point in each (ix, iy) cell.
+
+    Args:
+        shape (str): square, triangle or hexagon
+        ix (np.array): column index of the cell of each point
+        iy (np.array): row index of the cell of each point
+        grid_size (int): size of the cells in meters
+        cell_seed (np.array): seed of the cell of each point
+        point (np.array): number of each point within its cell
+    """
+
+    if shape == "square":
+        u = random_uniform(cell_seed, 2 * point)
+        v = random_uniform(cell_seed, 2 * point + 1)
+        return (ix + u) * grid_size, (iy + v) * grid_size
+
+    # split the cell in equal triangles around its centroid, pick one of them and a
+    # uniform point in it (folding the unit square on its diagonal)
+    vertices = cell_vertices(shape, ix, iy, grid_size)
+    center = np.stack(cell_centroids(shape, ix, iy, grid_size), -1)
+
+    n_corners = vertices.shape[1]
+    corner = (random_uniform(cell_seed, 3 * point) * n_corners).astype(int)
+    u = random_uniform(cell_seed, 3 * point + 1)[:, None]
+    v = random_uniform(cell_seed, 3 * point + 2)[:, None]
+    u, v = np.where(u + v > 1, 1 - u, u), np.where(u + v > 1, 1 - v, v)
+
+    rows = np.arange(len(center))
+    a = vertices[rows, corner] - center
+    b = vertices[rows, (corner + 1) % n_corners] - center
+
+    return tuple((center + u * a + v * b).T)
+
+
+def random_offsets(shape, seed, n_points):
+    """Returns the x and y offsets (in grid size units) of n_points random points from
+    the centroid of the first cell. They are shared by all the cells of the random
+    systematic design, down pointing triangles use the opposite offsets."""
+
+    zeros = np.zeros(n_points, dtype=np.int64)
+    x, y = random_points(
+        shape, zeros, zeros, 1, np.full(n_points, seed), np.arange(n_points)
+    )
+    cx, cy = cell_centroids(shape, 0, 0, 1)
+
+    return x - cx, y - cy
+
+
+def create_sample(model, grid, raster=None):
+    """Create sampling desing within the grid based on the strategy. Local counterpart
+    of gee_sampling.create_sample, drawing the same random points from the same seed
+    of each cell (see cell_seeds).
+
+    Args:
+        model (sbae.Model): the model will be used to get the default arguments that are
+            used to create the sample points such as: out_crs, seed, n_points and model.
+        grid (LocalGrid): grid in which the samples will be created
+        raster (LocalRaster, optional): categorical raster defining the strata of
+            strat_random
+    """
+
+    n_points = int(model.n_points)
+
+    if model.method == "random":
+
+        cell = np.repeat(np.arange(len(grid)), n_points)
+        point = np.tile(np.arange(n_points), len(grid))
+        cell_seed = cell_seeds(grid.ix[cell], grid.iy[cell], model.seed)
+
+        x, y = random_points(
+            grid.shape,
+            grid.ix[cell],
+            grid.iy[cell],
+            grid.grid_size,
+            cell_seed,
+            point,
+        )
+
+        return LocalSample(x, y, cell, grid.crs)
+
+    elif model.method == "rand_syst":
+
+        cell = np.repeat(np.arange(len(grid)), n_points)
+        point = np.tile(np.arange(n_points), len(grid))
+        dx, dy = random_offsets(grid.shape, model.seed, n_points)
+
+        sign = 1
+        if grid.shape == "triangle":
+            sign = np.where((grid.ix[cell] + grid.iy[cell]) % 2 == 0, 1, -1)
+
+        cx, cy = grid.centroids()
+        x = cx[cell] + sign * dx[point] * grid.grid_size
+        y = cy[cell] + sign * dy[point] * grid.grid_size
+
+        return LocalSample(x, y, cell, grid.crs)
+
+    elif model.method == "strat_random":
+
+        from component.scripts.local_sbae import LocalRaster, get_window_areas
+        from component.scripts.stratification import stratified_sample
+
+        if raster is None:
+            raise Exception(cm.error.non_cat_image)
+        elif not isinstance(raster, LocalRaster):
+            raise Exception(cm.error.non_local_image)
+
+        window_areas = get_window_areas(model, raster)
+
+        return stratified_sample(model, raster, grid.grid_size, window_areas)
+
+    elif model.method == "systematic":
+
+        x, y = grid.centroids()
+        return LocalSample(x, y, np.arange(len(grid)), grid.crs)
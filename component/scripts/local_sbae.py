@@ -0,0 +1,727 @@
+import concurrent.futures
+import contextlib
+import copy
+import multiprocessing
+import os
+import sys
+import types
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import shapely
+from pyproj import CRS, Transformer
+
+from component.scripts import local_sampling
+from component.scripts.cache import ResultCache, cache, sbae_keys
+from component.scripts.prepared_aoi import PreparedAoi
+from component.scripts.scripts import ModelView, category_key, get_grid_sizes
+
+EARTH_RADIUS = 6371007.181
+"float: radius (m) of the authalic sphere used to compute geographic pixel areas"
+DESIGN_MEMBERS = [
+    "method",
+    "shape",
+    "n_points",
+    "seed",
+    "out_crs",
+    "grid_size",
+    "allocation",
+    "clip",
+]
+"list: members of the model read by the local sampling, sent to the worker processes"
+
+
+class LocalRaster:
+    """Categorical raster that is read lazily, window by window.
+
+    Args:
+        array (np.array, rasterio.DatasetReader): 2D array (usually a np.memmap) or an
+            open rasterio dataset.
+        geotransform (tuple): GDAL ordered geotransform (x0, pixel width, 0, y0, 0,
+            -pixel height). North-up rasters only.
+        crs (str): crs of the raster
+        nodata (number, optional): value of the pixels to ignore
+        block_size (int): size (in pixels) of the windows read at once
+    """
+
+    def __init__(self, array, geotransform, crs, nodata=None, block_size=1024):
+
+        x0, px_w, rot_x, y0, rot_y, px_h = geotransform
+        if rot_x or rot_y:
+            raise Exception("Only north-up rasters are supported")
+
+        self.array = array
+        self.geotransform = tuple(geotransform)
+        self.crs = crs
+        self.nodata = nodata
+        self.block_size = block_size
+        self.height, self.width = (
+            array.shape[-2:] if hasattr(array, "shape") else (array.height, array.width)
+        )
+
+    @classmethod
+    def from_geotiff(cls, path, band=1, **kwargs):
+        """open a GeoTIFF without loading it. Requires rasterio"""
+
+        import rasterio
+
+        dataset = rasterio.open(path)
+        raster = cls(
+            dataset,
+            dataset.transform.to_gdal(),
+            dataset.crs.to_string(),
+            nodata=dataset.nodata,
+            **kwargs,
+        )
+        raster.band = band
+
+        return raster
+
+    @classmethod
+    def from_memmap(cls, path, shape, dtype, geotransform, crs, offset=0, **kwargs):
+        """map a raw binary array stored on disk"""
+
+        array = np.memmap(path, dtype=dtype, mode="r", shape=shape, offset=offset)
+
+        return cls(array, geotransform, crs, **kwargs)
+
+    def __getstate__(self):
+        """Rasters are sent to the worker processes by reference: memory mapped
+        arrays, shared memory blocks and rasterio datasets are opened again by the
+        workers instead of being copied. Other arrays are pickled."""
+
+        state = self.__dict__.copy()
+        array = self.array
+
+        if getattr(self, "shared_memory", None):
+            state["array"] = (
+                "shared",
+                self.shared_memory,
+                array.dtype.str,
+                array.shape,
+            )
+        elif isinstance(array, np.memmap) and array.base is array._mmap:
+            state["array"] = (
+                "memmap",
+                array.filename,
+                array.dtype.str,
+                array.shape,
+                array.offset,
+            )
+        elif not isinstance(array, np.ndarray):
+            state["array"] = ("rasterio", array.name)
+
+        return state
+
+    def __setstate__(self, state):
+
+        array = state["array"]
+
+        if isinstance(array, tuple) and array[0] == "shared":
+            # the block must stay open as long as the array is used
+            state["_block"] = attach_shared_memory(array[1])
+            state["array"] = np.ndarray(array[3], array[2], state["_block"].buf)
+        elif isinstance(array, tuple) and array[0] == "memmap":
+            _, path, dtype, shape, offset = array
+            state["array"] = np.memmap(
+                path, dtype=dtype, mode="r", shape=shape, offset=offset
+            )
+        elif isinstance(array, tuple) and array[0] == "rasterio":
+            import rasterio
+
+            state["array"] = rasterio.open(array[1])
+
+        self.__dict__.update(state)
+
+    @property
+    def is_geographic(self):
+        return CRS.from_user_input(self.crs).is_geographic
+
+    def read(self, row_off, col_off, height, width):
+        """returns the pixel values of the given window"""
+
+        if isinstance(self.array, np.ndarray):
+            return np.asarray(
+                self.array[row_off : row_off + height, col_off : col_off + width]
+            )
+
+        from rasterio.windows import Window
+
+        return self.array.read(
+            getattr(self, "band", 1), window=Window(col_off, row_off, width, height)
+        )
+
+    def pixel_area(self, rows):
+        """returns the area (ha) of the pixels in the given rows"""
+
+        x0, px_w, _, y0, _, px_h = self.geotransform
+        rows = np.asarray(rows)
+
+        if not self.is_geographic:
+            return np.full(rows.shape, abs(px_w * px_h) / 1e4)
+
+        top = np.radians(y0 + rows * px_h)
+        bottom = np.radians(y0 + (rows + 1) * px_h)
+        area = (
+            EARTH_RADIUS**2
+            * np.radians(abs(px_w))
+            * abs(np.sin(top) - np.sin(bottom))
+        )
+
+        return area / 1e4
+
+    def index(self, x, y):
+        """returns the row and column containing each coordinate (in the raster crs)"""
+
+        x0, px_w, _, y0, _, px_h = self.geotransform
+
+        cols = np.floor((np.asarray(x) - x0) / px_w).astype(np.int64)
+        rows = np.floor((np.asarray(y) - y0) / px_h).astype(np.int64)
+
+        return rows, cols
+
+    def sample(self, rows, cols):
+        """Returns the values at the given pixels and a validity mask. Pixels are read
+        grouped by window so only the windows containing a point are loaded."""
+
+        valid = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+        values = np.zeros(len(rows), dtype=self._dtype)
+
+        if isinstance(self.array, np.ndarray):
+            values[valid] = self.array[rows[valid], cols[valid]]
+
+        else:
+            bs = self.block_size
+            blocks = (rows // bs) * (self.width // bs + 1) + cols // bs
+            idx = np.flatnonzero(valid)
+            order = idx[np.argsort(blocks[idx], kind="stable")]
+            splits = np.flatnonzero(np.diff(blocks[order])) + 1
+
+            for group in np.split(order, splits):
+                if not len(group):
+                    continue
+                row_off = (rows[group[0]] // bs) * bs
+                col_off = (cols[group[0]] // bs) * bs
+                window = self.read(
+                    row_off,
+                    col_off,
+                    min(bs, self.height - row_off),
+                    min(bs, self.width - col_off),
+                )
+                values[group] = window[rows[group] - row_off, cols[group] - col_off]
+
+        if self.nodata is not None:
+            valid &= values != self.nodata
+
+        return values, valid
+
+    @property
+    def _dtype(self):
+        if isinstance(self.array, np.ndarray):
+            return self.array.dtype
+        return np.dtype(self.array.dtypes[getattr(self, "band", 1) - 1])
+
+    def windows(self, bounds=None):
+        """yields row_off, col_off, height, width of the windows within the bounds"""
+
+        row_start, col_start, row_stop, col_stop = 0, 0, self.height, self.width
+
+        if bounds is not None:
+            xmin, ymin, xmax, ymax = bounds
+            (r0, r1), (c0, c1) = self.index([xmin, xmax], [ymax, ymin])
+            row_start, row_stop = max(min(r0, r1), 0), min(max(r0, r1) + 1, self.height)
+            col_start, col_stop = max(min(c0, c1), 0), min(max(c0, c1) + 1, self.width)
+
+        bs = self.block_size
+        for row_off in range(row_start, row_stop, bs):
+            for col_off in range(col_start, col_stop, bs):
+                yield (
+                    row_off,
+                    col_off,
+                    min(bs, row_stop - row_off),
+                    min(bs, col_stop - col_off),
+                )
+
+
+def sum_by_category(values, area):
+    """returns a {class: area} dictionary with the area summed by class value"""
+
+    if not len(values):
+        return {}
+
+    classes, inverse = np.unique(values, return_inverse=True)
+    sums = np.bincount(inverse, weights=area, minlength=len(classes))
+
+    return {category_key(c): float(s) for c, s in zip(classes, sums)}
+
+
+def to_raster_crs(raster, crs):
+    """returns a function transforming x, y arrays from crs to the raster crs"""
+
+    transformer = Transformer.from_crs(crs, raster.crs, always_xy=True)
+
+    return lambda x, y: transformer.transform(x, y)
+
+
+def get_raster_aoi(model, raster, aoi=None):
+    """returns the AOI projected in the raster crs
+
+    Args:
+        model (sbae.Model): model used to get the AOI
+        raster (LocalRaster): raster giving the crs
+        aoi (shapely.Geometry, optional): AOI projected in model.out_crs. Defaults to
+            the unsimplified AOI of the model
+    """
+
+    aoi = model.prepared_aoi.exact.geometry if aoi is None else aoi
+    transform = to_raster_crs(raster, model.out_crs)
+    aoi = shapely.transform(aoi, lambda c: np.column_stack(transform(c[:, 0], c[:, 1])))
+    shapely.prepare(aoi)
+
+    return aoi
+
+
+def iter_aoi_pixels(raster, aoi, windows=None):
+    """Yields the window, the pixel values, the mask of the valid pixels whose center
+    is in the AOI and the pixel area (ha) of every window overlapping the AOI.
+
+    Args:
+        raster (LocalRaster): categorical raster
+        aoi (shapely.Geometry): prepared AOI in the raster crs
+        windows (list, optional): windows to read. All the windows within the AOI
+            bounds by default.
+    """
+
+    x0, px_w, _, y0, _, px_h = raster.geotransform
+
+    for window in raster.windows(aoi.bounds) if windows is None else windows:
+
+        row_off, col_off, height, width = window
+        rows = np.arange(row_off, row_off + height)
+        cols = np.arange(col_off, col_off + width)
+        xs = x0 + (cols + 0.5) * px_w
+        ys = y0 + (rows + 0.5) * px_h
+
+        inside = shapely.contains_xy(aoi, *np.meshgrid(xs, ys))
+        if not inside.any():
+            continue
+
+        values = raster.read(row_off, col_off, height, width)
+        if raster.nodata is not None:
+            inside &= values != raster.nodata
+
+        area = np.broadcast_to(raster.pixel_area(rows)[:, None], values.shape)
+
+        yield window, values, inside, area
+
+
+def get_area_by_category(model, raster, aoi=None, windows=None):
+    """Returns real area by category reading the raster window by window
+
+    Args:
+        model (sbae.Model): model used to get the AOI
+        raster (LocalRaster): categorical raster
+        aoi (shapely.Geometry, optional): AOI projected in model.out_crs
+        windows (list, optional): windows to read, see iter_aoi_pixels
+    """
+
+    aoi = get_raster_aoi(model, raster, aoi)
+    totals = {}
+
+    for _, values, inside, area in iter_aoi_pixels(raster, aoi, windows):
+
+        block = sum_by_category(values[inside], area[inside])
+
+        for key, value in block.items():
+            totals[key] = totals.get(key, 0) + value
+
+    return totals
+
+
+def get_window_areas(model, raster):
+    """Returns the windows of the raster overlapping the unsimplified AOI and their
+    area by category. They're read once per raster and AOI and stored in the cache,
+    with their sum as the real area, so the stratified designs of every grid size and
+    seed are allocated without reading the raster again.
+
+    Args:
+        model (sbae.Model): model used to get the AOI
+        raster (LocalRaster): categorical raster
+
+    Returns:
+        list: (window, area by category) of each window
+    """
+
+    real_key, _ = sbae_keys(model, raster, [])
+    key = ResultCache.key("window_areas", real_key, raster.block_size)
+
+    window_areas = cache.get(key)
+    if window_areas is None:
+
+        aoi = get_raster_aoi(model, raster)
+        window_areas = [
+            [list(window), sum_by_category(values[inside], area[inside])]
+            for window, values, inside, area in iter_aoi_pixels(raster, aoi)
+        ]
+        cache.set(key, window_areas)
+
+        if cache.get(real_key) is None:
+            real_area = {}
+            for _, areas in window_areas:
+                for category, value in areas.items():
+                    real_area[category] = real_area.get(category, 0) + value
+            cache.set(real_key, real_area)
+
+    return [(tuple(window), areas) for window, areas in window_areas]
+
+
+def get_simulated_area(model, raster, grid_size, aoi=None):
+    """Returns simulated area by category using the given grid size. The raster is
+    only read at the sample points.
+
+    Args:
+        model (sbae.model): sbae model to get the default values (user inputs) and pass
+            to the sampling creation
+        raster (LocalRaster): categorical raster to perform simulated based area
+            estimation.
+        grid_size (int): grid size to create the sampling design
+        aoi (shapely.Geometry, clipping.AoiIndex, optional): AOI projected in
+            model.out_crs
+    """
+
+    aoi = local_sampling.get_aoi_index(model, aoi)
+
+    grid = local_sampling.get_grid(model, grid_size, aoi)
+    sample = local_sampling.create_sample(model, grid, raster)
+
+    # only the points within the AOI are taken into account, as in the GEE reduction
+    sample = local_sampling.clip_sample(sample, grid, aoi)
+    x, y = to_raster_crs(raster, model.out_crs)(sample.x, sample.y)
+
+    rows, cols = raster.index(x, y)
+    values, valid = raster.sample(rows, cols)
+
+    # weighted designs estimate the areas from the area represented by each point
+    area = raster.pixel_area(rows) if sample.weight is None else sample.weight
+
+    return sum_by_category(values[valid], area[valid])
+
+
+def get_simulated_areas(model, raster, grid_sizes, aoi=None):
+    """Returns simulated area by category for all the grid sizes with a single raster
+    lookup. Points shared by several designs are only read once and carry one bit per
+    grid size they belong to.
+
+    Args:
+        model (sbae.model): sbae model to get the default values (user inputs)
+        raster (LocalRaster): categorical raster
+        grid_sizes (list): grid sizes to create the sampling designs
+        aoi (shapely.Geometry, clipping.AoiIndex, optional): AOI projected in
+            model.out_crs
+    """
+
+    aoi = local_sampling.get_aoi_index(model, aoi)
+
+    # the weights of the stratified points depend on their design, they can't be merged
+    if model.method == "strat_random":
+        return {gs: get_simulated_area(model, raster, gs, aoi) for gs in grid_sizes}
+
+    # only the points within the AOI are taken into account, as in the GEE reduction
+    xs, ys, tags = [], [], []
+    for i, grid_size in enumerate(grid_sizes):
+        grid = local_sampling.get_grid(model, grid_size, aoi)
+        sample = local_sampling.create_sample(model, grid, raster)
+        sample = local_sampling.clip_sample(sample, grid, aoi)
+        xs.append(sample.x)
+        ys.append(sample.y)
+        tags.append(np.full(len(sample), 2**i, dtype=np.int64))
+
+    # merge the points located at the same place combining their tags
+    coords, inverse = np.unique(
+        np.column_stack([np.concatenate(xs), np.concatenate(ys)]),
+        axis=0,
+        return_inverse=True,
+    )
+    tag = np.zeros(len(coords), dtype=np.int64)
+    np.bitwise_or.at(tag, inverse.ravel(), np.concatenate(tags))
+
+    x, y = to_raster_crs(raster, model.out_crs)(coords[:, 0], coords[:, 1])
+
+    rows, cols = raster.index(x, y)
+    values, valid = raster.sample(rows, cols)
+    area = raster.pixel_area(rows)
+
+    simulated_areas = {}
+    for i, grid_size in enumerate(grid_sizes):
+        mask = valid & (tag & 2**i > 0)
+        simulated_areas[grid_size] = sum_by_category(values[mask], area[mask])
+
+    return simulated_areas
+
+
+def simulate_areas(
+    model,
+    raster,
+    single_pass=False,
+    refresh=False,
+    grid_sizes=None,
+    processes=None,
+):
+    """Local counterpart of gee_sbae.simulate_areas. Results already stored in the
+    cache are not recomputed.
+
+    Args:
+        model (sbae.model): sbae model with the user inputs
+        raster (LocalRaster): categorical raster
+        single_pass (bool): read the raster once for all the grid sizes
+        refresh (bool): ignore the cached results and compute them again
+        grid_sizes (list, optional): grid sizes to simulate. Defaults to
+            scripts.get_grid_sizes(model)
+        processes (int, optional): compute the grid sizes in this many worker
+            processes (see simulate_parallel). 0 to use every core.
+
+    Returns:
+        (dict, dict): simulated area by category for each grid size and real area by
+            category, as consumed by processing.get_sbae_error.
+    """
+
+    if processes is not None:
+        runs, real_area = simulate_parallel(
+            model, raster, [model.seed], refresh, grid_sizes, processes
+        )
+        return (runs[0], real_area)
+
+    aoi = local_sampling.get_aoi_index(model)
+    grid_sizes = grid_sizes or get_grid_sizes(model)
+    real_key, sim_keys = sbae_keys(model, raster, grid_sizes)
+
+    real_area, simulated_areas = cache.lookup(real_key, sim_keys, refresh)
+    missing = [gs for gs in grid_sizes if gs not in simulated_areas]
+
+    if single_pass and missing:
+        results = get_simulated_areas(model, raster, missing, aoi)
+    else:
+        results = {
+            grid_size: get_simulated_area(model, raster, grid_size, aoi)
+            for grid_size in missing
+        }
+
+    for grid_size, result in results.items():
+        simulated_areas[grid_size] = result
+        cache.set(sim_keys[grid_size], result)
+
+    if real_area is None:
+        real_area = get_area_by_category(model, raster)
+        cache.set(real_key, real_area)
+
+    return (simulated_areas, real_area)
+
+
+def simulate_seeds(
+    model,
+    raster,
+    seeds,
+    single_pass=True,
+    refresh=False,
+    grid_sizes=None,
+    processes=None,
+):
+    """Run simulate_areas once per seed, to get the distribution of the SBAE error of
+    random designs.
+
+    Args:
+        model (sbae.model): sbae model with the user inputs
+        raster (LocalRaster): categorical image
+        seeds (list): seeds of the runs
+        single_pass (bool): see simulate_areas
+        refresh (bool): see simulate_areas
+        grid_sizes (list, optional): see simulate_areas
+        processes (int, optional): see simulate_areas
+
+    Returns:
+        (list, dict): simulated areas of each run and the real area by category, as
+            consumed by processing.get_sbae_error_mc.
+    """
+
+    if processes is not None:
+        return simulate_parallel(model, raster, seeds, refresh, grid_sizes, processes)
+
+    runs = []
+    for seed in seeds:
+        simulated_areas, real_area = simulate_areas(
+            ModelView(model, seed=seed), raster, single_pass, refresh, grid_sizes
+        )
+        runs.append(simulated_areas)
+
+    return (runs, real_area)
+
+
+@contextlib.contextmanager
+def shared_raster(raster):
+    """Yields the raster as it's sent to the worker processes. In-memory arrays are
+    copied once into a shared memory block, released when leaving the context. File
+    based rasters are opened again by the workers (see LocalRaster.__getstate__)."""
+
+    array = raster.array
+    in_memory = isinstance(array, np.ndarray) and not (
+        isinstance(array, np.memmap) and array.base is array._mmap
+    )
+
+    if not in_memory:
+        yield raster
+        return
+
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = copy.copy(raster)
+    shared.array = np.ndarray(array.shape, array.dtype, block.buf)
+    shared.array[:] = array
+    shared.shared_memory = block.name
+
+    try:
+        yield shared
+    finally:
+        # the buffer can only be released once no array uses it anymore
+        shared.array = None
+        block.close()
+        block.unlink()
+
+
+def attach_shared_memory(name):
+    """Attaches an existing shared memory block without registering it to the
+    resource tracker. Only the process creating the block unlinks it, a worker
+    registering it (Python < 3.13) would unlink it or report it as leaked when it
+    exits."""
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name)
+    finally:
+        resource_tracker.register = register
+
+
+_worker = {}
+"dict: raster and model of the current worker process of simulate_parallel"
+
+
+def _init_worker(raster, aoi, exact, design):
+    """receive the raster, the AOI and the design once per worker process"""
+
+    prepared_aoi = PreparedAoi.from_geometry(aoi, design["out_crs"], exact)
+
+    _worker["raster"] = raster
+    _worker["model"] = types.SimpleNamespace(
+        **design, cat_image=raster, prepared_aoi=prepared_aoi
+    )
+
+
+def _simulated_area_task(seed, grid_size):
+    """simulated area of one (seed, grid size) design in a worker process"""
+
+    model = ModelView(_worker["model"], seed=seed)
+    aoi = model.prepared_aoi.index
+
+    return get_simulated_area(model, _worker["raster"], grid_size, aoi)
+
+
+def _real_area_task(windows):
+    """real area of some windows of the raster in a worker process"""
+
+    model = _worker["model"]
+
+    return get_area_by_category(model, _worker["raster"], None, windows)
+
+
+def simulate_parallel(
+    model, raster, seeds, refresh=False, grid_sizes=None, processes=None
+):
+    """Computes the simulated areas of every (seed, grid size) design and the real
+    area in a pool of worker processes, as the CPU bound work of the local engine
+    doesn't scale with threads.
+
+    The raster is shared with the workers instead of being sent with every task:
+    memory mapped and GeoTIFF rasters are opened again by the workers and in-memory
+    arrays are copied once into shared memory (see shared_raster). Each design is one
+    task and the real area is split by raster windows, the per-class areas are summed
+    in the main process. Cached results are not recomputed.
+
+    Args:
+        model (sbae.model): sbae model with the user inputs
+        raster (LocalRaster): categorical raster
+        seeds (list): seeds of the runs
+        refresh (bool): see simulate_areas
+        grid_sizes (list, optional): see simulate_areas
+        processes (int, optional): number of worker processes, every core by default
+
+    Returns:
+        (list, dict): simulated areas of each run and the real area by category, as
+            simulate_seeds
+    """
+
+    grid_sizes = grid_sizes or get_grid_sizes(model)
+    processes = processes or os.cpu_count()
+
+    # the real area doesn't depend on the seed
+    real_key, _ = sbae_keys(model, raster, [])
+    real_area, _ = cache.lookup(real_key, {}, refresh)
+
+    keys, runs = {}, {}
+    for seed in seeds:
+        _, keys[seed] = sbae_keys(ModelView(model, seed=seed), raster, grid_sizes)
+        _, runs[seed] = cache.lookup(real_key, keys[seed], refresh)
+
+    tasks = [(s, gs) for s in seeds for gs in grid_sizes if gs not in runs[s]]
+
+    if tasks or real_area is None:
+
+        # the strata areas are computed once and read from the cache by the workers
+        if model.method == "strat_random" and tasks:
+            get_window_areas(model, raster)
+
+        aoi = local_sampling.get_aoi_geometry(model)
+        exact = model.prepared_aoi.exact.geometry
+        design = {name: getattr(model, name) for name in DESIGN_MEMBERS}
+
+        # forking a process with running threads (e.g. the scheduler or the batch
+        # workers) can copy locks held by another thread, the workers are started clean
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        )
+
+        with shared_raster(raster) as shared, concurrent.futures.ProcessPoolExecutor(
+            processes,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(shared, aoi, exact, design),
+        ) as pool:
+
+            futures = {pool.submit(_simulated_area_task, *task): task for task in tasks}
+
+            # several window chunks per process to balance the load
+            real_futures = []
+            if real_area is None:
+                bounds = get_raster_aoi(model, raster).bounds
+                windows = list(raster.windows(bounds))
+                n_chunks = min(len(windows), processes * 4)
+                real_futures = [
+                    pool.submit(_real_area_task, windows[i::n_chunks])
+                    for i in range(n_chunks)
+                ]
+
+            for future in concurrent.futures.as_completed(futures):
+                seed, grid_size = futures[future]
+                runs[seed][grid_size] = future.result()
+                cache.set(keys[seed][grid_size], runs[seed][grid_size])
+
+            if real_area is None:
+                real_area = {}
+                for future in real_futures:
+                    for key, value in future.result().items():
+                        real_area[key] = real_area.get(key, 0) + value
+                cache.set(real_key, real_area)
+
+    return ([runs[seed] for seed in seeds], real_area)
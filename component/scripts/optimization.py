@@ -0,0 +1,115 @@
+import math
+
+import numpy as np
+
+from component.scripts.processing import get_sbae_error
+
+__all__ = ["max_class_error", "find_grid_size"]
+
+
+def max_class_error(simulated_areas, real_area, classes=None, min_share=0):
+    """Returns the error of the worst class for each grid size.
+
+    Args:
+        simulated_areas (dict): simulated area by category of each grid size
+        real_area (dict): real area by category
+        classes (list, optional): classes to check (as the keys of real_area). All the
+            classes by default.
+        min_share (float): when classes are not given, ignore the classes covering
+            less than this share of the AOI
+
+    Returns:
+        pd.Series: error (%) indexed by grid size
+    """
+
+    error = get_sbae_error(simulated_areas, real_area)
+
+    if classes is None:
+        total = sum(real_area.values())
+        classes = [key for key, area in real_area.items() if area >= min_share * total]
+
+    error = error.loc[error.index.intersection(classes)]
+
+    return error.max(skipna=True)
+
+
+def find_grid_size(
+    simulate,
+    target_error,
+    lower,
+    upper,
+    classes=None,
+    min_share=0,
+    known=(),
+    resolution=100,
+    tolerance=0.05,
+    max_evaluations=8,
+):
+    """Search the coarsest grid size for which the error of every selected class stays
+    below the target.
+
+    The search starts from the grid sizes that are already computed (cached results
+    are free) to bracket the target and then bisects the bracket in log space, so
+    each evaluation halves the ratio between a passing and a failing grid size. The
+    SBAE error is a noisy function of the grid size, the result is the coarsest
+    passing grid size found at the crossing of the bracket.
+
+    Args:
+        simulate (callable): simulate(grid_sizes) returns the simulated areas of each
+            grid size and the real area, as simulate_areas does
+        target_error (float): maximum error (%) of the selected classes
+        lower (int): smallest grid size to consider (m)
+        upper (int): largest grid size to consider (m)
+        classes (list, optional): see max_class_error
+        min_share (float): see max_class_error
+        known (list): grid sizes already computed (e.g. the ones of the SBAE curve),
+            used to narrow the search before bisecting
+        resolution (int): precision of the returned grid size (m)
+        tolerance (float): the search stops when the passing and failing grid sizes
+            are closer than this share of the grid size
+        max_evaluations (int): maximum number of grid sizes computed by the bisection
+
+    Returns:
+        (int, dict): the coarsest grid size meeting the target (None if even the
+            smallest one fails) and the error of every evaluated grid size
+    """
+
+    errors = {}
+
+    def evaluate(grid_sizes):
+        grid_sizes = [gs for gs in grid_sizes if gs not in errors]
+        if grid_sizes:
+            simulated_areas, real_area = simulate(grid_sizes)
+            errors.update(
+                max_class_error(simulated_areas, real_area, classes, min_share)
+            )
+
+    evaluate(sorted({lower, upper, *[gs for gs in known if lower < gs < upper]}))
+
+    # bracket the target between the finest failing grid size and the passing grid
+    # size right below it
+    failing = sorted(gs for gs, error in errors.items() if not error <= target_error)
+
+    if not failing:
+        return upper, errors
+    elif failing[0] == lower:
+        return None, errors
+
+    high = failing[0]
+    low = max(gs for gs in errors if gs < high)
+
+    for _ in range(max_evaluations):
+
+        if high - low <= max(resolution, tolerance * low):
+            break
+
+        middle = int(round(math.sqrt(low * high) / resolution) * resolution)
+        middle = int(np.clip(middle, low + resolution, high - resolution))
+        evaluate([middle])
+
+        if errors[middle] <= target_error:
+            low = middle
+        else:
+            high = middle
+
+    return low, errors
@@ -0,0 +1,181 @@
+import copy
+import threading
+import types
+
+import shapely
+from sepal_ui.scripts.decorator import need_ee
+
+from component.message import cm
+
+__all__ = ["PreparedAoi"]
+
+
+class PreparedAoi:
+    """AOI of the model prepared once and shared by every sampling and SBAE call.
+
+    The AOI is dissolved, projected in the output crs and, when a tolerance is given,
+    simplified without changing its topology. The shapely geometry, its bounds, area
+    and clipping index are computed on first use and then reused. The ee.Geometry is
+    built once on the client, so every request sends the same (simplified) graph
+    instead of dissolving and projecting the AOI again.
+
+    Args:
+        aoi_model (sepal_ui.aoi.AoiModel): model holding the selected AOI
+        crs (str): projected crs of the prepared geometries
+        tolerance (float): simplification tolerance in meters, 0 to keep every vertex
+    """
+
+    def __init__(self, aoi_model, crs, tolerance=0):
+
+        self.feature_collection = aoi_model.feature_collection
+        self.gdf = aoi_model.gdf
+        self.crs = crs
+        self.tolerance = tolerance
+
+        self.lock = threading.Lock()
+        self._geometry = None
+        self._index = None
+        self._ee_geometry = None
+        self._exact = None
+
+    @classmethod
+    def from_geometry(cls, geometry, crs, exact=None):
+        """Returns a PreparedAoi of a shapely geometry already projected in crs,
+        without ee counterpart (e.g. in the worker processes of the local engine).
+
+        Args:
+            geometry (shapely.Geometry): AOI projected in crs
+            crs (str): projected crs of the geometry
+            exact (shapely.Geometry, optional): unsimplified AOI, if geometry is a
+                simplified one
+        """
+
+        aoi = cls(types.SimpleNamespace(feature_collection=None, gdf=None), crs)
+        shapely.prepare(geometry)
+        aoi._geometry = geometry
+
+        if exact is not None:
+            aoi._exact = cls.from_geometry(exact, crs)
+
+        return aoi
+
+    def matches(self, aoi_model, crs, tolerance):
+        """returns True if the AOI was prepared from the same inputs"""
+
+        return (
+            aoi_model.feature_collection is self.feature_collection
+            and aoi_model.gdf is self.gdf
+            and crs == self.crs
+            and tolerance == self.tolerance
+        )
+
+    @property
+    def geometry(self):
+        """shapely.Geometry: dissolved and prepared AOI projected in crs"""
+
+        with self.lock:
+            if self._geometry is None:
+
+                if self.gdf is None:
+                    raise Exception(cm.error.no_aoi)
+
+                geometry = self.gdf.to_crs(self.crs).unary_union
+                if self.tolerance:
+                    geometry = shapely.simplify(
+                        geometry, self.tolerance, preserve_topology=True
+                    )
+
+                shapely.prepare(geometry)
+                self._geometry = geometry
+
+        return self._geometry
+
+    @property
+    def index(self):
+        """clipping.AoiIndex: spatial index of the geometry"""
+
+        from component.scripts.clipping import AoiIndex
+
+        geometry = self.geometry
+
+        with self.lock:
+            if self._index is None:
+                self._index = AoiIndex(geometry)
+
+        return self._index
+
+    @property
+    def exact(self):
+        """PreparedAoi: the same AOI without simplification (itself when the tolerance
+        is 0). The real area is computed over it, so it's shared by every design
+        whatever its grid size"""
+
+        with self.lock:
+            if self._exact is None:
+                if self.tolerance:
+                    aoi_model = types.SimpleNamespace(
+                        feature_collection=self.feature_collection, gdf=self.gdf
+                    )
+                    self._exact = PreparedAoi(aoi_model, self.crs)
+                else:
+                    self._exact = self
+
+        return self._exact
+
+    @property
+    def bounds(self):
+        """tuple: xmin, ymin, xmax, ymax of the geometry in crs"""
+
+        return self.geometry.bounds
+
+    @property
+    def area(self):
+        """float: area of the geometry in hectares"""
+
+        return self.geometry.area / 1e4
+
+    @property
+    @need_ee
+    def ee_geometry(self):
+        """ee.Geometry: dissolved AOI projected in crs"""
+
+        import ee
+
+        with self.lock:
+            if self._ee_geometry is None:
+
+                if not self.feature_collection:
+                    raise Exception(cm.error.no_aoi)
+
+                max_error = max(self.tolerance, 1)
+                geometry = ee.FeatureCollection(self.feature_collection).geometry()
+                geometry = geometry.transform(self.crs, max_error)
+                if self.tolerance:
+                    geometry = geometry.simplify(max_error, self.crs)
+
+                self._ee_geometry = geometry
+
+        return self._ee_geometry
+
+    @need_ee
+    def shard(self, bounds):
+        """Returns the part of the AOI within the bounds as a PreparedAoi.
+
+        Args:
+            bounds (tuple): xmin, ymin, xmax, ymax of the shard in crs
+        """
+
+        import ee
+
+        rectangle = ee.Geometry.Rectangle(list(bounds), self.crs, False)
+        geometry = shapely.clip_by_rect(self.geometry, *bounds)
+        shapely.prepare(geometry)
+
+        shard = copy.copy(self)
+        shard.lock = threading.Lock()
+        shard._geometry = geometry
+        shard._index = None
+        shard._ee_geometry = self.ee_geometry.intersection(rectangle, 1, self.crs)
+        shard._exact = self.exact.shard(bounds) if self.tolerance else None
+
+        return shard
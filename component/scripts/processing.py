@@ -1,31 +1,188 @@
-import pandas as pd
+import math
+import warnings
+
+import numpy as np
+
+import component.parameter as param
+
+
+def to_arrays(sim_runs, real_class_areas):
+    """Convert the simulated and real areas into arrays.
+
+    Args:
+        sim_runs (list): simulated areas of each run, as returned by simulate_areas
+            ({grid_size: {class: area}})
+        real_class_areas (dict): real area by class
+
+    Returns:
+        (list, list, np.array, np.array): sorted classes, sorted grid sizes, the
+            (runs x grid sizes x classes) simulated areas (0 when a class is not
+            sampled) and the real area of each class (nan when it's not in the map)
+    """
+
+    grid_sizes = sorted(set().union(*[run.keys() for run in sim_runs]))
+    classes = sorted(
+        set(real_class_areas).union(
+            *[areas.keys() for run in sim_runs for areas in run.values()]
+        )
+    )
+    class_index = {class_: i for i, class_ in enumerate(classes)}
+
+    sim = np.zeros((len(sim_runs), len(grid_sizes), len(classes)))
+    for r, run in enumerate(sim_runs):
+        for g, grid_size in enumerate(grid_sizes):
+            for class_, area in run.get(grid_size, {}).items():
+                sim[r, g, class_index[class_]] = area
+
+    real = np.array([real_class_areas.get(class_, np.nan) for class_ in classes])
+
+    return classes, grid_sizes, sim, real
+
+
+def sbae_error(sim, real):
+    """Relative error (%) of the area of each class estimated from the sample
+    proportions, broadcasted over the leading dimensions of sim.
+
+    Args:
+        sim (np.array): (... x classes) simulated area
+        real (np.array): (classes) real area
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+
+        # get the proportion of each class over the total simulated area and the
+        # "simulated" area, multiplying the proportion by total real area
+        rate = sim / sim.sum(axis=-1, keepdims=True)
+        estimated = rate * np.nansum(real)
+
+        # get the absolute difference between the simulated and the real area
+        return np.abs(np.nan_to_num(real) - estimated) / real * 100
 
 
 def get_sbae_error(sim_class_areas, real_class_areas):
     """Calculates the area error from each class"""
 
-    grid_sizes = sim_class_areas.keys()
+    import pandas as pd
+
+    classes, grid_sizes, sim, real = to_arrays([sim_class_areas], real_class_areas)
+
+    return pd.DataFrame(sbae_error(sim[0], real).T, index=classes, columns=grid_sizes)
+
+
+def refine_grid_sizes(error, target_error, max_new=2, resolution=100):
+    """Proposes new grid sizes to refine the SBAE curve where it crosses the target
+    error, instead of spending server time on the uninformative parts of the curve.
+
+    New sizes are the geometric middle of the consecutive grid sizes whose errors
+    bracket the target. When the whole curve is below (above) the target, it is
+    extended beyond the largest (below the smallest) grid size.
+
+    Args:
+        error (pd.Series): error (%) indexed by the computed grid sizes
+        target_error (float): target error (%)
+        max_new (int): maximum number of grid sizes returned
+        resolution (int): new grid sizes are rounded to this value (m)
+
+    Returns:
+        list: new grid sizes, empty when the curve is already refined as much as the
+            resolution allows
+    """
+
+    error = error.dropna().sort_index()
+    sizes, values = error.index.to_numpy(dtype=float), error.to_numpy(dtype=float)
+
+    if not len(sizes):
+        return []
+
+    above = values > target_error
+    if above.all():
+        candidates = [sizes[0] / 2]
+    elif not above.any():
+        candidates = [sizes[-1] * 2]
+    else:
+        crossing = np.flatnonzero(above[:-1] != above[1:])
+        candidates = np.sqrt(sizes[crossing] * sizes[crossing + 1])
+
+    new = []
+    for candidate in candidates:
+        grid_size = int(round(candidate / resolution) * resolution)
+        if grid_size >= resolution and grid_size not in sizes and grid_size not in new:
+            new.append(grid_size)
+
+    return new[:max_new]
+
+
+def reduction_scale(
+    native_scale,
+    aoi_area,
+    grid_size=None,
+    max_pixels=param.REDUCTION_PIXELS,
+    pyramid=True,
+):
+    """Chooses the scale of the SBAE reductions of an image over an AOI.
+
+    The scale is the native scale of the image, coarsened until the AOI holds at most
+    max_pixels pixels, but kept below half the grid size so the sample points of a
+    design stay in distinct pixels. With pyramid, the scale is snapped to a pyramid
+    level of the image (native scale times a power of 2) that EE reads without
+    resampling.
+
+    Args:
+        native_scale (float): nominal scale (m) of the image
+        aoi_area (float): area (ha) of the AOI
+        grid_size (int, optional): smallest grid size (m) of the designs
+        max_pixels (float): target number of pixels of the AOI
+        pyramid (bool): snap the scale to the pyramid levels of the image
+
+    Returns:
+        float: scale (m), never finer than the native one
+    """
+
+    scale = max(native_scale, math.sqrt(aoi_area * 1e4 / max_pixels))
+    cap = grid_size / 2 if grid_size else math.inf
+
+    if pyramid:
+        level = math.ceil(math.log2(scale / native_scale) - 1e-9)
+        if cap < scale:
+            level = min(level, math.floor(math.log2(cap / native_scale)))
+        return native_scale * 2 ** max(level, 0)
+
+    return max(native_scale, min(scale, cap))
+
+
+def get_sbae_error_mc(sim_runs, real_class_areas, percentiles=(5, 95)):
+    """Monte Carlo statistics of the area error of each class over several runs (e.g.
+    one per seed) of the same grid sizes.
 
-    # convert gee real area result into pd.df and sort it by its grid_sizes
-    real_df = pd.DataFrame.from_dict(real_class_areas, orient="index").sort_index()
-    # repeat the column (just to subtract it later easier)
-    real_df = pd.concat([real_df] * len(grid_sizes), axis=1)
-    real_df.columns = grid_sizes
+    Args:
+        sim_runs (list): simulated areas of each run ({grid_size: {class: area}})
+        real_class_areas (dict): real area by class
+        percentiles (tuple): lower and upper percentiles of the error band
 
-    # convert gee sbae result into pd.df and sort it by its grid_size
-    sim_df = pd.DataFrame.from_dict(sim_class_areas)[sorted(grid_sizes)]
+    Returns:
+        dict: mean, std, lower and upper error as (class x grid size) DataFrames,
+            shaped as get_sbae_error output
+    """
 
-    # get the proportion of each class over the total simulated area.
-    sim_df_rate = sim_df / sim_df.sum()
+    import pandas as pd
 
-    total_real_area = real_df.sum().iloc[0]
+    classes, grid_sizes, sim, real = to_arrays(sim_runs, real_class_areas)
 
-    # get the "simulated" area, multiplying the proportion by total_real_area
-    sim_df_mult_real_area = sim_df_rate * (real_df.sum().iloc[0])
+    error = sbae_error(sim, real)
 
-    # get the absolute difference between the simulated and the real area
-    abs_diff_df = abs(real_df.subtract(sim_df_mult_real_area, axis=1, fill_value=0))
+    # classes that are not in the map have nan errors in every run
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
 
-    diff_rate_df = (abs_diff_df / real_df) * 100
+        lower, upper = np.nanpercentile(error, percentiles, axis=0)
+        stats = {
+            "mean": np.nanmean(error, axis=0),
+            "std": np.nanstd(error, axis=0),
+            "lower": lower,
+            "upper": upper,
+        }
 
-    return diff_rate_df
+    return {
+        name: pd.DataFrame(values.T, index=classes, columns=grid_sizes)
+        for name, values in stats.items()
+    }
@@ -0,0 +1,210 @@
+import collections
+import concurrent.futures
+import random
+import threading
+import time
+
+__all__ = ["Cancelled", "Scheduler", "scheduler"]
+
+QUOTA_ERRORS = (
+    "too many concurrent",
+    "quota",
+    "rate limit",
+    "429",
+    "resource exhausted",
+)
+"tuple: lower case fragments of the EE error messages that are worth a retry"
+
+
+class Cancelled(Exception):
+    """Raised by the requests of a cancelled group"""
+
+
+class Scheduler:
+    """Run every Earth Engine request of the app through the same gate.
+
+    Requests are limited by a global concurrency cap and a token bucket, retried with
+    exponential backoff (and jitter) when EE answers with a quota error and timed.
+    Requests belong to a group (e.g. "design" or "sbae") that can be cancelled when
+    the user changes the inputs: queued tasks are dropped and running ones stop at
+    their next request.
+
+    Args:
+        max_concurrent (int): maximum number of requests sent at the same time
+        rate (float): sustained number of requests per second
+        burst (int): number of requests that can be sent at once before the rate
+            limit applies
+        max_retries (int): retries of a request failing with a quota error
+        backoff (float): first retry delay (s), doubled at each retry
+        max_workers (int): threads running the submitted tasks
+    """
+
+    def __init__(
+        self,
+        max_concurrent=10,
+        rate=10,
+        burst=20,
+        max_retries=5,
+        backoff=1,
+        max_workers=32,
+    ):
+
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_workers = max_workers
+
+        self.lock = threading.Lock()
+        self.tokens = burst
+        self.last = time.monotonic()
+
+        self.generations = collections.defaultdict(int)
+        self.local = threading.local()
+        self.metrics = collections.deque(maxlen=1000)
+
+        self._executor = None
+
+    @property
+    def executor(self):
+        """concurrent.futures.ThreadPoolExecutor: pool created on first use"""
+
+        with self.lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="ee"
+                )
+
+        return self._executor
+
+    def acquire_token(self):
+        """wait until the token bucket allows a new request"""
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.last) * self.rate
+                )
+                self.last = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def cancel(self, group):
+        """cancel every queued and running request of the group"""
+
+        with self.lock:
+            self.generations[group] += 1
+
+    def check(self):
+        """raise Cancelled if the group of the running task has been cancelled"""
+
+        context = getattr(self.local, "context", None)
+        if context is not None and self.generations[context[0]] != context[1]:
+            raise Cancelled(context[0])
+
+    @staticmethod
+    def is_quota_error(error):
+        return any(fragment in str(error).lower() for fragment in QUOTA_ERRORS)
+
+    def call(self, function, *args, name=None, **kwargs):
+        """Send a request (any function calling the EE servers) through the gate and
+        return its result"""
+
+        name = name or getattr(function, "__qualname__", str(function))
+        start, attempt = time.perf_counter(), 0
+
+        while True:
+
+            self.check()
+            self.acquire_token()
+
+            try:
+                with self.slots:
+                    result = function(*args, **kwargs)
+                break
+
+            except Exception as e:
+                if not self.is_quota_error(e) or attempt >= self.max_retries:
+                    self.record(name, start, attempt, type(e).__name__)
+                    raise
+
+                delay = self.backoff * 2**attempt
+                time.sleep(delay + random.uniform(0, delay / 2))
+                attempt += 1
+
+        self.record(name, start, attempt, "ok")
+
+        return result
+
+    def get_info(self, ee_object, name=None):
+        """getInfo of an ee object through the gate"""
+
+        return self.call(ee_object.getInfo, name=name)
+
+    def submit(self, function, *args, group=None, **kwargs):
+        """Run function(*args, **kwargs) in the pool, as part of the group. Tasks
+        submitted from another task without a group belong to the same group.
+
+        Returns:
+            concurrent.futures.Future
+        """
+
+        context = getattr(self.local, "context", None)
+        if group is not None or context is None:
+            group = group or "default"
+            context = (group, self.generations[group])
+
+        def task():
+
+            self.local.context = context
+            try:
+                self.check()
+                return function(*args, **kwargs)
+            finally:
+                self.local.context = None
+
+        return self.executor.submit(task)
+
+    def record(self, name, start, retries, status):
+        """save the metrics of a request"""
+
+        self.metrics.append(
+            {
+                "name": name,
+                "seconds": time.perf_counter() - start,
+                "retries": retries,
+                "status": status,
+            }
+        )
+
+    def summary(self):
+        """returns the number of calls, retries and the mean/max time per request name"""
+
+        summary = {}
+        for metric in list(self.metrics):
+            entry = summary.setdefault(
+                metric["name"], {"calls": 0, "retries": 0, "errors": 0, "seconds": []}
+            )
+            entry["calls"] += 1
+            entry["retries"] += metric["retries"]
+            entry["errors"] += metric["status"] != "ok"
+            entry["seconds"].append(metric["seconds"])
+
+        for entry in summary.values():
+            seconds = entry.pop("seconds")
+            entry["mean_s"] = sum(seconds) / len(seconds)
+            entry["max_s"] = max(seconds)
+
+        return summary
+
+
+scheduler = Scheduler()
+"Scheduler: gate shared by every Earth Engine request of the app"
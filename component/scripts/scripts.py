@@ -1,5 +1,7 @@
+import json
 from pathlib import Path
 
+import component.parameter as param
 import component.parameter.directory as dir_
 
 
@@ -23,3 +25,47 @@ def get_filename(model, ext):
     result_folder.mkdir(parents=True, exist_ok=True)
 
     return (result_folder / filename).with_suffix(ext)
+
+
+def get_grid_sizes(model):
+    """returns the sorted grid sizes of the SBAE curve: the ones requested in
+    model.sbae_grid_sizes or the user grid size times param.GRID_MULTIPLIERS"""
+
+    grid_sizes = model.sbae_grid_sizes or [
+        model.grid_size * mult for mult in param.GRID_MULTIPLIERS
+    ]
+
+    return sorted(set(int(grid_size) for grid_size in grid_sizes))
+
+
+def category_key(value):
+    """returns the dictionary key of a class value, formatted as ee.String.encodeJSON
+    does it so local and GEE results can be compared"""
+
+    value = value.item() if hasattr(value, "item") else value
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+
+    return json.dumps(value)
+
+
+class ModelView:
+    """Read only view of a model overriding some of its members. Used to run the same
+    design with another seed or grid size without touching the model bound to the UI.
+
+    Args:
+        model (sbae.Model): model to read the members from
+        **overrides: members to override
+    """
+
+    def __init__(self, model, **overrides):
+
+        self._model = model
+        self._overrides = overrides
+
+    def __getattr__(self, name):
+
+        if name in self._overrides:
+            return self._overrides[name]
+
+        return getattr(self._model, name)
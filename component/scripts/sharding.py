@@ -0,0 +1,172 @@
+import concurrent.futures
+import math
+
+import numpy as np
+import shapely
+
+import component.parameter as param
+from component.scripts.cache import cache, sbae_keys
+from component.scripts.scheduler import Cancelled, scheduler
+from component.scripts.scripts import ModelView, get_grid_sizes
+
+__all__ = ["get_shards", "shard_model", "merge_areas", "simulate_areas_sharded"]
+
+
+def get_shards(model, grid_sizes, shard_size=param.SHARD_SIZE):
+    """Returns the bounds of the square shards covering the prepared AOI.
+
+    The side of the shards is a multiple of the largest grid size, so the shards are
+    aligned on the square cells of that grid only. The cells of the other grid sizes
+    (e.g. 3 or 4 times the user grid size) and the hexagons or triangles can straddle
+    two shards. Each shard builds them, but it only keeps the points within its own
+    part of the AOI, and the points of a cell don't depend on the shard (see
+    gee_sampling.random_sample). The merged areas are exact because of this per
+    shard filtering of the points, not because of the alignment.
+
+    Args:
+        model (sbae.Model): model with the prepared AOI
+        grid_sizes (list): grid sizes of the SBAE
+        shard_size (int): approximate side (m) of the shards
+
+    Returns:
+        list: xmin, ymin, xmax, ymax of the shards intersecting the AOI
+    """
+
+    step = max(grid_sizes) * max(1, round(shard_size / max(grid_sizes)))
+
+    aoi = model.prepared_aoi
+    xmin, ymin, xmax, ymax = aoi.bounds
+
+    i, j = np.meshgrid(
+        np.arange(math.floor(xmin / step), math.ceil(xmax / step)),
+        np.arange(math.floor(ymin / step), math.ceil(ymax / step)),
+    )
+    bounds = np.column_stack([i.ravel(), j.ravel(), i.ravel() + 1, j.ravel() + 1])
+    bounds = bounds * step
+
+    inside = shapely.intersects(aoi.geometry, shapely.box(*bounds.T))
+
+    return [tuple(b) for b in bounds[inside].tolist()]
+
+
+def shard_model(model, bounds):
+    """returns a view of the model restricted to the part of the AOI within bounds"""
+
+    return ModelView(model, prepared_aoi=model.prepared_aoi.shard(bounds), shard_size=0)
+
+
+def merge_areas(results):
+    """returns the sum of the area by category of the given results"""
+
+    merged = {}
+    for areas in results:
+        for key, area in areas.items():
+            merged[key] = merged.get(key, 0) + area
+
+    return merged
+
+
+def simulate_areas_sharded(
+    model,
+    cat_image,
+    refresh=False,
+    grid_sizes=None,
+    group=None,
+    on_progress=None,
+    scale=None,
+):
+    """Sharded counterpart of gee_sbae.simulate_areas for very large AOIs.
+
+    The AOI is split in shards (see get_shards) and the real area and the simulated
+    areas (in a single pass) of each shard are two independent requests, at most
+    param.MAX_RUNNING_SHARDS running at a time. The requests don't wait for any other
+    task, so they can't exhaust the scheduler pool whatever the number of sharded
+    jobs. The areas are sums so the results of the shards are merged exactly. Each
+    shard has its own cache entries: a failing request is retried
+    param.SHARD_RETRIES times and, if the whole job fails anyway, running it again
+    only computes the missing shards.
+
+    Args:
+        model (sbae.model): sbae model with the user inputs and model.shard_size
+        cat_image (ee.Image): categorical image
+        refresh (bool): see gee_sbae.simulate_areas
+        grid_sizes (list, optional): see gee_sbae.simulate_areas
+        group (str, optional): see gee_sbae.simulate_areas
+        on_progress (callable, optional): called with the simulated areas and the
+            real area once every shard is merged
+        scale (float, optional): scale (m) of the reductions. Defaults to the scale of
+            the whole AOI, so every shard uses the same one
+
+    Returns:
+        (dict, dict): simulated area by category for each grid size and real area by
+            category, as gee_sbae.simulate_areas
+    """
+
+    from component.scripts import gee_sbae
+
+    grid_sizes = grid_sizes or get_grid_sizes(model)
+    scale = scale or gee_sbae.get_reduction_scale(model, cat_image)
+
+    shards, keys, results, pending = {}, {}, {}, []
+    for bounds in get_shards(model, grid_sizes, model.shard_size):
+
+        shards[bounds] = shard_model(model, bounds)
+        keys[bounds] = sbae_keys(shards[bounds], cat_image, grid_sizes, scale)
+        real_area, simulated_areas = cache.lookup(*keys[bounds], refresh)
+        results[bounds] = (simulated_areas, real_area)
+
+        missing = [gs for gs in grid_sizes if gs not in simulated_areas]
+        if missing:
+            pending.append((bounds, tuple(missing)))
+        if real_area is None:
+            pending.append((bounds, None))
+
+    def run(bounds, missing):
+        if missing is None:
+            return gee_sbae.get_area_by_category(shards[bounds], cat_image, scale)
+
+        return gee_sbae.get_simulated_areas(shards[bounds], cat_image, missing, scale)
+
+    retries, running = {}, {}
+    while pending or running:
+
+        while pending and len(running) < param.MAX_RUNNING_SHARDS:
+            request = pending.pop(0)
+            running[scheduler.submit(run, *request, group=group)] = request
+
+        done, _ = concurrent.futures.wait(
+            running, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in done:
+
+            request = running.pop(future)
+            error = future.exception()
+
+            if error is None:
+                bounds, missing = request
+                real_key, sim_keys = keys[bounds]
+                if missing is None:
+                    results[bounds] = (results[bounds][0], future.result())
+                    cache.set(real_key, future.result())
+                else:
+                    for grid_size, areas in future.result().items():
+                        results[bounds][0][grid_size] = areas
+                        cache.set(sim_keys[grid_size], areas)
+            elif isinstance(error, Cancelled) or retries.get(request, 0) >= (
+                param.SHARD_RETRIES
+            ):
+                raise error
+            else:
+                retries[request] = retries.get(request, 0) + 1
+                pending.append(request)
+
+    simulated_areas = {
+        grid_size: merge_areas(sim[grid_size] for sim, _ in results.values())
+        for grid_size in grid_sizes
+    }
+    real_area = merge_areas(real for _, real in results.values())
+
+    if on_progress:
+        on_progress(simulated_areas, real_area)
+
+    return (simulated_areas, real_area)
@@ -0,0 +1,175 @@
+import json
+
+import numpy as np
+from pyproj import Transformer
+
+import component.parameter as param
+
+__all__ = ["get_n_points", "allocate", "stratum_weights", "stratified_sample"]
+
+
+def get_n_points(model, total_area, grid_size):
+    """returns the number of points of a stratified design with the same density as
+    the random design of the given grid size
+
+    Args:
+        model (sbae.Model): model with the number of points per cell
+        total_area (float): area (ha) of the AOI
+        grid_size (int): size of the cells in meters
+    """
+
+    return int(round(total_area * 1e4 / grid_size**2 * int(model.n_points)))
+
+
+def allocate(areas, n_points, allocation="proportional", user_accuracy=None):
+    """Splits the points between the strata.
+
+    Neyman allocation uses the standard deviation S_h = sqrt(U_h (1 - U_h)) of each
+    stratum, where U_h is its anticipated user's accuracy. By default rare classes
+    (less than param.MIN_CLASS_SHARE of the AOI) are expected to be mapped less
+    accurately (param.RARE_CLASS_ACCURACY) than the others
+    (param.EXPECTED_ACCURACY), so they receive more points than with a proportional
+    allocation.
+
+    Args:
+        areas (dict): area by stratum, as returned by get_area_by_category
+        n_points (int): total number of points
+        allocation (str): proportional, equal or neyman
+        user_accuracy (dict, optional): anticipated user's accuracy of each stratum
+
+    Returns:
+        dict: number of points of each stratum, summing to n_points
+    """
+
+    strata = [key for key, area in areas.items() if area > 0]
+    area = np.array([areas[key] for key in strata], dtype="f8")
+
+    if not len(strata):
+        return {}
+
+    if allocation == "proportional":
+        weights = area
+
+    elif allocation == "equal":
+        weights = np.ones(len(strata))
+
+    elif allocation == "neyman":
+        share = area / area.sum()
+        default = np.where(
+            share < param.MIN_CLASS_SHARE,
+            param.RARE_CLASS_ACCURACY,
+            param.EXPECTED_ACCURACY,
+        )
+        user_accuracy = user_accuracy or {}
+        accuracy = np.array(
+            [user_accuracy.get(key, d) for key, d in zip(strata, default)]
+        )
+        weights = area * np.sqrt(accuracy * (1 - accuracy))
+
+    else:
+        raise ValueError(f"Unknown allocation: {allocation}")
+
+    # largest remainder rounding, to keep the total number of points
+    quotas = n_points * weights / weights.sum()
+    counts = np.floor(quotas).astype(int)
+    remainder = np.argsort(counts - quotas)[: n_points - counts.sum()]
+    counts[remainder] += 1
+
+    return dict(zip(strata, counts.tolist()))
+
+
+def stratum_weights(areas, n_strata):
+    """Returns the area represented by a point of each stratum (area of the stratum
+    divided by its number of points). The SBAE estimates weight the points with it,
+    otherwise a non proportional allocation would bias the estimated areas towards
+    the oversampled strata.
+
+    Args:
+        areas (dict): area by stratum
+        n_strata (dict): number of points of each stratum, as returned by allocate
+    """
+
+    return {key: areas[key] / n for key, n in n_strata.items() if n}
+
+
+def stratified_sample(model, raster, grid_size, window_areas):
+    """Stratified random sample of a local categorical raster, read window by window.
+
+    The points of each stratum are allocated from the area of the strata (the real
+    area of the AOI) and distributed among the windows with one multinomial draw.
+    Only the windows receiving points are read, the points are drawn among the pixels
+    of their stratum (weighted by the pixel area).
+
+    Args:
+        model (sbae.Model): model with the AOI, seed, n_points and allocation
+        raster (LocalRaster): categorical raster defining the strata
+        grid_size (int): size of the cells of the equivalent random design
+        window_areas (list): area by category of the windows overlapping the AOI, as
+            returned by local_sbae.get_window_areas
+
+    Returns:
+        LocalSample: points in model.out_crs
+    """
+
+    from component.scripts import local_sampling, local_sbae
+
+    aoi = local_sbae.get_raster_aoi(model, raster)
+    windows = [window for window, _ in window_areas]
+    window_areas = [areas for _, areas in window_areas]
+
+    totals = {}
+    for areas in window_areas:
+        for key, value in areas.items():
+            totals[key] = totals.get(key, 0) + value
+
+    n_points = get_n_points(model, sum(totals.values()), grid_size)
+    n_strata = allocate(totals, n_points, model.allocation)
+    point_weights = stratum_weights(totals, n_strata)
+
+    # number of points of each stratum in each window
+    rng = np.random.default_rng(model.seed)
+    draws = {}
+    for key, n in n_strata.items():
+        p = np.array([areas.get(key, 0) for areas in window_areas]) / totals[key]
+        draws[key] = rng.multinomial(n, p / p.sum())
+
+    selected = [i for i in range(len(windows)) if any(d[i] for d in draws.values())]
+    pixels = local_sbae.iter_aoi_pixels(raster, aoi, [windows[i] for i in selected])
+
+    x0, px_w, _, y0, _, px_h = raster.geotransform
+    xs, ys, ws = [np.empty(0)], [np.empty(0)], [np.empty(0)]
+
+    for i, (window, values, inside, area) in zip(selected, pixels):
+
+        row_off, col_off = window[:2]
+
+        for key, draw in draws.items():
+
+            if not draw[i]:
+                continue
+
+            candidates = np.flatnonzero(inside & (values == json.loads(key)))
+            weights = area.ravel()[candidates]
+            chosen = rng.choice(
+                candidates,
+                draw[i],
+                replace=draw[i] > len(candidates),
+                p=weights / weights.sum(),
+            )
+
+            # random location within the chosen pixels
+            rows, cols = np.divmod(chosen, values.shape[1])
+            xs.append(x0 + (col_off + cols + rng.random(len(chosen))) * px_w)
+            ys.append(y0 + (row_off + rows + rng.random(len(chosen))) * px_h)
+            ws.append(np.full(len(chosen), point_weights[key]))
+
+    transformer = Transformer.from_crs(raster.crs, model.out_crs, always_xy=True)
+    x, y = transformer.transform(np.concatenate(xs), np.concatenate(ys))
+
+    return local_sampling.LocalSample(
+        np.asarray(x),
+        np.asarray(y),
+        np.full(len(x), -1),
+        model.out_crs,
+        np.concatenate(ws),
+    )
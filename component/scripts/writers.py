@@ -0,0 +1,182 @@
+import abc
+import json
+
+import numpy as np
+
+__all__ = ["get_writer", "CsvWriter", "OgrWriter", "ParquetWriter"]
+
+WKB_POINT = np.dtype([("order", "u1"), ("type", "<u4"), ("x", "<f8"), ("y", "<f8")])
+"np.dtype: packed little endian WKB point (21 bytes)"
+
+
+def wkb_points(x, y):
+    """returns the WKB encoding of the points as one contiguous buffer"""
+
+    points = np.empty(len(x), dtype=WKB_POINT)
+    points["order"], points["type"] = 1, 1
+    points["x"], points["y"] = x, y
+
+    return points.tobytes()
+
+
+def arrow_table(plotid, lat, lon):
+    """Build a pyarrow table with the CEO layout and a WKB geometry column. The WKB
+    column is built from raw buffers, no python object is created per point."""
+
+    import pyarrow as pa
+
+    offsets = np.arange(0, WKB_POINT.itemsize * (len(lon) + 1), WKB_POINT.itemsize)
+    geometry = pa.Array.from_buffers(
+        pa.binary(),
+        len(lon),
+        [
+            None,
+            pa.py_buffer(offsets.astype(np.int32)),
+            pa.py_buffer(wkb_points(lon, lat)),
+        ],
+    )
+
+    return pa.table(
+        {
+            "PLOTID": pa.array(plotid),
+            "LAT": pa.array(lat),
+            "LON": pa.array(lon),
+            "geometry": geometry,
+        }
+    )
+
+
+class Writer(abc.ABC):
+    """Write the sample points chunk by chunk with a fixed PLOTID/LAT/LON layout.
+    Coordinates are received as flat float64 arrays in EPSG:4326. A design without
+    points is exported as an empty file with the same layout.
+
+    Args:
+        filename (pathlib.Path): output file
+    """
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, lon, lat):
+        """append a chunk of points. PLOTID keeps growing from one chunk to the next"""
+
+        plotid = np.arange(self.count, self.count + len(lon), dtype=np.int64)
+        self._write(plotid, np.asarray(lat, "f8"), np.asarray(lon, "f8"))
+        self.count += len(lon)
+
+    @abc.abstractmethod
+    def _write(self, plotid, lat, lon):
+        """write the chunk of points to the file"""
+
+    def close(self):
+        """creates the file with the layout only if no point was written"""
+
+        if not self.count:
+            self._write(np.empty(0, np.int64), np.empty(0), np.empty(0))
+
+
+class CsvWriter(Writer):
+    def _write(self, plotid, lat, lon):
+
+        import pandas as pd
+
+        pd.DataFrame({"PLOTID": plotid, "LAT": lat, "LON": lon}).to_csv(
+            self.filename,
+            index=False,
+            mode="a" if self.count else "w",
+            header=not self.count,
+        )
+
+
+class OgrWriter(Writer):
+    """Vector file writer. Every chunk is sent to GDAL as one arrow batch, which is
+    written in a single transaction. Falls back on geopandas if pyogrio (>=0.8) or
+    pyarrow are not available."""
+
+    def __init__(self, filename, driver):
+
+        super().__init__(filename)
+        self.driver = driver
+
+    def _write(self, plotid, lat, lon):
+
+        try:
+            from pyogrio.raw import write_arrow
+
+            write_arrow(
+                arrow_table(plotid, lat, lon),
+                self.filename,
+                driver=self.driver,
+                geometry_name="geometry",
+                geometry_type="Point",
+                crs="EPSG:4326",
+                append=bool(self.count),
+            )
+
+        except ImportError:
+
+            import geopandas as gpd
+
+            gpd.GeoDataFrame(
+                {"PLOTID": plotid, "LAT": lat, "LON": lon},
+                geometry=gpd.points_from_xy(lon, lat),
+                crs="EPSG:4326",
+            ).to_file(
+                self.filename, driver=self.driver, mode="a" if self.count else "w"
+            )
+
+
+class ParquetWriter(Writer):
+    """GeoParquet writer, every chunk is written as a row group"""
+
+    metadata = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {"geometry": {"encoding": "WKB", "geometry_types": ["Point"]}},
+    }
+
+    def __init__(self, filename):
+
+        super().__init__(filename)
+        self.writer = None
+
+    def _write(self, plotid, lat, lon):
+
+        import pyarrow.parquet as pq
+
+        table = arrow_table(plotid, lat, lon)
+
+        if self.writer is None:
+            schema = table.schema.with_metadata({"geo": json.dumps(self.metadata)})
+            self.writer = pq.ParquetWriter(self.filename, schema)
+
+        self.writer.write_table(
+            table.replace_schema_metadata(self.writer.schema.metadata)
+        )
+
+    def close(self):
+
+        super().close()
+        self.writer.close()
+
+
+def get_writer(filename, export_method):
+    """returns the writer of the given export method (csv, gpkg, shp or parquet)"""
+
+    if export_method == "csv":
+        return CsvWriter(filename)
+    elif export_method == "gpkg":
+        return OgrWriter(filename, "GPKG")
+    elif export_method == "shp":
+        return OgrWriter(filename, "ESRI Shapefile")
+    elif export_method == "parquet":
+        return ParquetWriter(filename)
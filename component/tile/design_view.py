@@ -1,13 +1,9 @@
-import time
-from importlib import reload
 from random import randint
-from timeit import default_timer as timer
 
 import ipyvuetify as v
-import nest_asyncio
 import sepal_ui.sepalwidgets as sw
 from sepal_ui.scripts.decorator import loading_button
-from traitlets import CInt, dlink, link
+from traitlets import CInt, dlink
 
 from component.message import cm
 
@@ -20,11 +16,11 @@ class DesignView(sw.Layout):
     methods = {
         "systematic": True,
         "random": True,
-        "rand_syst": False,
-        "strat_random": False,
+        "rand_syst": True,
+        "strat_random": True,
     }
 
-    shapes = {"square": True, "triangle": False, "hexagon": False}
+    shapes = {"square": True, "triangle": True, "hexagon": True}
 
     def __init__(self, model, map_, resume_view, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -44,6 +40,17 @@ class DesignView(sw.Layout):
             v_model=next(iter(self.methods)),
         )
 
+        self.w_allocation = sw.Select(
+            label=cm.design.allocation.label,
+            hint=cm.design.allocation.hint,
+            persistent_hint=True,
+            items=[
+                {"value": k, "text": cm.design.allocation[k]}
+                for k in ["proportional", "equal", "neyman"]
+            ],
+            v_model="proportional",
+        ).hide()
+
         self.w_shape = sw.Select(
             label=cm.design.shape.label,
             items=[
@@ -74,6 +81,7 @@ class DesignView(sw.Layout):
 
         self.children = [
             self.w_method,
+            self.w_allocation,
             self.w_shape,
             sw.Layout(
                 class_="pa-0 ma-0",
@@ -100,6 +108,7 @@ class DesignView(sw.Layout):
 
         self.model.bind(self.w_npoints, "n_points")
         self.model.bind(self.w_method, "method")
+        self.model.bind(self.w_allocation, "allocation")
         self.model.bind(self.w_shape, "shape")
         self.model.bind(self.w_size, "grid_size")
 
@@ -154,6 +163,11 @@ class DesignView(sw.Layout):
             self.w_npoints.hide()
             self.w_random.hide()
 
+        if change["new"] == "strat_random":
+            self.w_allocation.show()
+        else:
+            self.w_allocation.hide()
+
 
 class RandomInt(sw.Layout):
 
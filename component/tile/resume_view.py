@@ -1,9 +1,8 @@
-from timeit import default_timer as timer
-
 import sepal_ui.sepalwidgets as sw
 
 from component.message import cm
-from component.widget.save_dialog import SaveDialog
+from component.scripts import local_sampling
+from component.scripts.scheduler import scheduler
 
 
 class ResumeView(sw.Card):
@@ -80,7 +79,30 @@ class ResumeView(sw.Card):
         self.shape_placeh.children = [cm.design.shape[self.model.shape]]
         self.seed_placeh.children = [f"{self.model.seed}"]
 
-        # Save this number into the module since this is something
-        # time consuming.
-        self.model.nsamples = self.model.points.size().getInfo()
+        # Local samples already know their size. Counting the EE ones is time
+        # consuming, so an estimate is displayed while the exact size is requested in
+        # the background and saved into the model.
+        if self.model.nsamples is not None:
+            self.npoints_placeh.children = [str(self.model.nsamples)]
+            return
+
+        self.model.estimated_nsamples = local_sampling.estimate_sample_size(self.model)
+        self.npoints_placeh.children = [
+            cm.results.estimated.format(self.model.estimated_nsamples)
+        ]
+
+        points = self.model.points
+        future = scheduler.submit(
+            scheduler.get_info, points.size(), name="sample_size", group="design"
+        )
+        future.add_done_callback(lambda f: self._set_nsamples(f, points))
+
+    def _set_nsamples(self, future, points):
+        """Save the size of the points once counted, unless the sample has changed
+        or the request was cancelled in the meantime"""
+
+        if future.exception() is not None or self.model.points is not points:
+            return
+
+        self.model.nsamples = future.result()
         self.npoints_placeh.children = [str(self.model.nsamples)]
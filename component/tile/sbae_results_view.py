@@ -1,4 +1,3 @@
-import plotly.graph_objects as go
 import sepal_ui.sepalwidgets as sw
 
 from component.message import cm
@@ -21,15 +20,12 @@ class SbaeResultsView(sw.Card):
         self.w_description = sw.CardText(children=[cm.sbae.description])
         self.w_classes = sw.Select(label=cm.sbae.classes.label, v_model=None)
 
-        self.fig = go.FigureWidget()
-        self.fig.update_layout(
-            template="plotly_dark",
-            template_layout_paper_bgcolor="#1a1a1a",
-            title_text="SBAE",
-        )
-        self.fig.add_trace(go.Scatter())
+        # plotly is only loaded when the first results are displayed
+        self.fig = None
+        self.diff_rate_df = None
+        self.bands = None
 
-        self.w_desc_fig = sw.CardText(children=[self.w_classes, self.fig]).hide()
+        self.w_desc_fig = sw.CardText(children=[self.w_classes]).hide()
 
         self.children = [
             title,
@@ -37,29 +33,75 @@ class SbaeResultsView(sw.Card):
             self.w_desc_fig,
         ]
 
+        self.w_classes.observe(self.update_figure, "v_model")
+
     def loading_mode(self):
         """show loading cards and hide any previous graph displayed"""
 
         self.w_description.show()
         self.w_desc_fig.hide()
 
-    def update_content(self, diff_rate_df):
-        """Use the received dataframe to create and update the graphs"""
+    def create_figure(self):
+        """create the plotly figure widget and add it to the card"""
 
-        self.w_classes.items = diff_rate_df.index.to_list()
+        import plotly.graph_objects as go
 
-        def update(change):
+        self.fig = go.FigureWidget()
+        self.fig.update_layout(
+            template="plotly_dark",
+            template_layout_paper_bgcolor="#1a1a1a",
+            title_text="SBAE",
+            showlegend=False,
+        )
 
-            class_ = change["new"]
-            data = diff_rate_df.loc[class_]
-            lines = go.Scatter(
-                x=data.index,
-                y=data.values,
+        # lower and upper bounds of the error band, then the error line
+        self.fig.add_trace(go.Scatter(mode="lines", line_width=0, hoverinfo="skip"))
+        self.fig.add_trace(
+            go.Scatter(
+                mode="lines",
+                line_width=0,
+                fill="tonexty",
+                fillcolor="rgba(99, 110, 250, 0.3)",
+                hoverinfo="skip",
             )
-            self.fig.update_traces(lines)
-            self.fig.update_layout(title_text=f"SBAE / class {class_}")
+        )
+        self.fig.add_trace(go.Scatter())
+
+        self.w_desc_fig.children = [self.w_classes, self.fig]
+
+    def update_content(self, diff_rate_df, bands=None):
+        """Use the received dataframe to create and update the graphs
+
+        Args:
+            diff_rate_df (pd.DataFrame): (class x grid size) error, in %
+            bands (tuple, optional): lower and upper (class x grid size) error
+                DataFrames, displayed as a band around the error line
+        """
+
+        if self.fig is None:
+            self.create_figure()
 
-        self.w_classes.observe(update, "v_model")
+        self.diff_rate_df = diff_rate_df
+        self.bands = bands
+
+        self.w_classes.items = diff_rate_df.index.to_list()
+        self.update_figure({"new": self.w_classes.v_model})
 
         self.w_description.hide()
         self.w_desc_fig.show()
+
+    def update_figure(self, change):
+        """display the error of the selected class"""
+
+        class_ = change["new"]
+        if self.fig is None or class_ not in self.diff_rate_df.index:
+            return
+
+        data = self.diff_rate_df.loc[class_]
+        lower, upper = [band.loc[class_] for band in self.bands or []] or [None, None]
+
+        with self.fig.batch_update():
+            self.fig.data[0].update(x=None if lower is None else data.index, y=lower)
+            self.fig.data[1].update(x=None if upper is None else data.index, y=upper)
+            self.fig.data[2].update(x=data.index, y=data.values)
+            self.fig.update_layout(title_text=f"SBAE / class {class_}")
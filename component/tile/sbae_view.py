@@ -1,13 +1,22 @@
 import ee
 import sepal_ui.sepalwidgets as sw
-from sepal_ui.scripts.decorator import loading_button, switch
-from traitlets import CInt, dlink, link
+from sepal_ui.scripts.decorator import need_ee, switch
 
+import component.parameter as param
 from component.message import cm
-from component.scripts.gee_sbae import simulate_areas
-from component.scripts.processing import get_sbae_error
-
-ee.Initialize()
+from component.scripts.gee_sbae import (
+    get_reduction_scale,
+    simulate_areas,
+    simulate_seeds,
+)
+from component.scripts.optimization import find_grid_size
+from component.scripts.processing import (
+    get_sbae_error,
+    get_sbae_error_mc,
+    refine_grid_sizes,
+)
+from component.scripts.scheduler import Cancelled, scheduler
+from component.scripts.scripts import get_grid_sizes
 
 
 class SbaeView(sw.Card):
@@ -18,6 +27,7 @@ class SbaeView(sw.Card):
     def __init__(self, model, map_, sbae_result_view, *args, **kwargs):
 
         self.asset = None
+        self.job = None
 
         super().__init__(*args, **kwargs)
 
@@ -35,23 +45,55 @@ class SbaeView(sw.Card):
 
         self.w_properties = sw.Select(label=cm.sbae.properties, v_model=None).hide()
         self.w_value = sw.Select(label=cm.sbae.value, v_model=None).hide()
+        self.w_seeds = sw.TextField(
+            type="number", label=cm.sbae.seeds, v_model=1, hint=cm.sbae.seeds_hint
+        )
+
+        self.w_grid_sizes = sw.Combobox(
+            label=cm.sbae.grid_sizes,
+            hint=cm.sbae.grid_sizes_hint,
+            persistent_hint=True,
+            v_model=[],
+            multiple=True,
+            chips=True,
+            small_chips=True,
+            deletable_chips=True,
+        )
+        self.w_target = sw.TextField(type="number", label=cm.sbae.target, v_model=10)
 
         self.btn = sw.Btn(cm.sbae.button)
+        self.btn_refine = sw.Btn(cm.sbae.refine, outlined=True, class_="ml-2")
+        self.btn_optimize = sw.Btn(cm.sbae.optimize, outlined=True, class_="ml-2")
+        self.btn_cancel = sw.Btn(
+            cm.sbae.cancel, icon="mdi-close", outlined=True, class_="ml-2"
+        ).hide()
 
         self.children = [
             self.w_asset,
             self.w_properties,
             self.w_value,
+            self.w_seeds,
+            self.w_grid_sizes,
+            self.w_target,
             self.alert,
             self.btn,
+            self.btn_refine,
+            self.btn_optimize,
+            self.btn_cancel,
         ]
 
         self.w_asset.observe(self._process_asset, "v_model")
         self.w_properties.observe(self._fill_values, "v_model")
         self.w_value.observe(self.filter_fc, "v_model")
+        self.w_grid_sizes.observe(self._set_grid_sizes, "v_model")
+        self.model.observe(self._show_grid_sizes, "sbae_grid_sizes")
         self.btn.on_event("click", self._compute_sbae)
+        self.btn_refine.on_event("click", self._refine_sbae)
+        self.btn_optimize.on_event("click", self._optimize_sbae)
+        self.btn_cancel.on_event("click", self._cancel_sbae)
         self._process_asset({"new": "users/amitghosh/sdg_module/esa/cci_landcover"})
 
+    @need_ee
     def filter_fc(self, *args):
         """use user's input to filter feature collection and save asset member"""
 
@@ -60,22 +102,31 @@ class SbaeView(sw.Card):
                 ee.Filter.eq(self.w_properties.v_model, self.w_value.v_model)
             ).first()
         )
+        self.model.cat_image = self.asset
 
     @switch("loading", on_widgets=["w_value"])
+    @need_ee
     def _fill_values(self, change):
         """fill w_value items with all the aggregate array info from the selected property"""
 
-        self.w_value.items = self.fc.aggregate_array(change["new"]).getInfo()
+        values = self.fc.aggregate_array(change["new"])
+        self.w_value.items = scheduler.get_info(values, name="asset_values")
 
+    @need_ee
     def _process_asset(self, change):
         """process feature collection when is selected in asset widget"""
 
+        # results computed for the previous asset are not needed anymore
+        self._cancel_sbae()
+
         if self.w_asset.asset_info["type"] == "IMAGE_COLLECTION":
 
             self.fc = ee.FeatureCollection(change["new"])
             properties = [
                 prop
-                for prop in self.fc.propertyNames().getInfo()
+                for prop in scheduler.get_info(
+                    self.fc.propertyNames(), name="asset_properties"
+                )
                 if prop != "system:id"
             ] + ["system:index"]
             self.w_properties.items = properties
@@ -84,25 +135,249 @@ class SbaeView(sw.Card):
 
         else:
             self.asset = ee.Image(change["new"])
+            self.model.cat_image = self.asset
             self.w_properties.hide()
             self.w_value.hide()
 
-    @switch("loading", on_widgets=["sbae_result_view"])
-    @loading_button(debug=True)
     def _compute_sbae(self, widget, event, data):
-        """Event to trigger the computation of sbae based on user inputs"""
+        """Event to trigger the computation of sbae based on user inputs. The
+        computation runs in the background and the results are displayed as they
+        arrive, so the kernel stays responsive and the job can be cancelled."""
+
+        # a new computation supersedes the running one
+        self._cancel_sbae()
+
+        if self.asset is None:
+            self.alert.add_msg(cm.error.non_cat_image, "error")
+            return
+
+        # the field accepts any number (or text), only positive integers are valid
+        try:
+            n_seeds = int(str(self.w_seeds.v_model or 1))
+        except ValueError:
+            n_seeds = 0
+
+        if n_seeds < 1:
+            self.alert.add_msg(cm.error.invalid_seeds, "error")
+            return
+
+        # systematic designs don't depend on the seed, a single run is enough
+        if self.model.method == "systematic":
+            n_seeds = 1
 
         self.sbae_result_view.loading_mode()
+        self.set_running(True)
+        self.alert.update_progress(0, msg=cm.sbae.progress)
 
-        simulated_areas, real_area = simulate_areas(self.model, self.asset)
+        self.job = scheduler.submit(self._run_sbae, n_seeds, group="sbae")
+        self.job.add_done_callback(self._sbae_done)
 
-        map_asset = self.asset.clip(self.model.aoi_model.feature_collection.geometry())
-        self.map_.addLayer(map_asset.randomVisualizer(), {}, "Categorical image")
+    def _run_sbae(self, n_seeds):
+        """compute the simulated areas of every run, showing the partial results.
+        Returns the runs, the real area and the scale of the reductions"""
+
+        # the same scale is used by every run and request of the job
+        scale = get_reduction_scale(self.model, self.asset)
+
+        if n_seeds > 1:
+            seeds = [self.model.seed + i for i in range(n_seeds)]
+            runs, real_area = simulate_seeds(
+                self.model,
+                self.asset,
+                seeds,
+                on_progress=lambda runs, real_area: self._show_results(
+                    runs, real_area, len(runs) / n_seeds
+                ),
+                scale=scale,
+            )
+            return runs, real_area, scale
+
+        # one request per grid size (instead of a single pass) so the results are
+        # displayed as each of them and the real area are completed
+        n_requests = len(get_grid_sizes(self.model)) + 1
+        simulated_areas, real_area = simulate_areas(
+            self.model,
+            self.asset,
+            single_pass=False,
+            on_progress=lambda areas, real_area: self._show_results(
+                [areas], real_area, (len(areas) + (real_area is not None)) / n_requests
+            ),
+            scale=scale,
+        )
 
-        diff_rate_df = get_sbae_error(simulated_areas, real_area)
+        return [simulated_areas], real_area, scale
 
-        self.sbae_result_view.update_content(diff_rate_df)
+    def _show_results(self, runs, real_area, progress):
+        """update the progress and display the errors of the runs received so far"""
+
+        # a cancelled job must not overwrite the view
+        scheduler.check()
+
+        self.alert.update_progress(progress, msg=cm.sbae.progress)
+
+        if real_area is None or not runs[0]:
+            return
+
+        if len(runs) > 1:
+            stats = get_sbae_error_mc(runs, real_area)
+            diff_rate_df, bands = stats["mean"], (stats["lower"], stats["upper"])
+        else:
+            diff_rate_df, bands = get_sbae_error(runs[0], real_area), None
+
+        self.sbae_result_view.update_content(diff_rate_df, bands)
+
+    def _sbae_done(self, future):
+        """display the final results (or the error) of the job"""
+
+        # the results of a superseded or cancelled job are discarded
+        if future is not self.job:
+            return
+
+        self.job = None
+        self.set_running(False)
+
+        error = future.exception()
+        if isinstance(error, Cancelled):
+            self.alert.add_msg(cm.sbae.cancelled, "warning")
+            return
+        elif error is not None:
+            self.alert.add_msg(str(error), "error")
+            return
+
+        # the refinements read the computed grid sizes from the cache
+        runs, real_area, scale = future.result()
+        self.model.sbae_scale = scale
+        self._show_results(runs, real_area, 1)
+        self.alert.add_msg(cm.sbae.scale.format(scale), "success")
+
+        map_asset = self.asset.clip(self.model.prepared_aoi.ee_geometry)
+        self.map_.addLayer(map_asset.randomVisualizer(), {}, "Categorical image")
 
         # Open this card when the process is complete
         self.map_.addLayer(self.model.aoi_model.feature_collection)
         self.map_.sbae_result_control.menu.v_model = True
+
+    def _set_grid_sizes(self, change):
+        """save the valid grid sizes typed by the user in the model"""
+
+        grid_sizes = []
+        for value in change["new"] or []:
+            try:
+                grid_sizes.append(int(float(value)))
+            except ValueError:
+                continue
+
+        self.model.sbae_grid_sizes = sorted(set(gs for gs in grid_sizes if gs > 0))
+
+        # display the cleaned values (it triggers this method once more)
+        if self.model.sbae_grid_sizes != change["new"]:
+            self.w_grid_sizes.v_model = self.model.sbae_grid_sizes
+
+    def _show_grid_sizes(self, change):
+        """display the grid sizes set by the model, e.g. reset by a new grid size"""
+
+        if self.w_grid_sizes.v_model != change["new"]:
+            self.w_grid_sizes.v_model = change["new"]
+
+    def _refine_sbae(self, widget, event, data):
+        """Add grid sizes where the error of the selected class (or of the worst one)
+        crosses the target error and compute them. The grid sizes already computed
+        are read from the cache."""
+
+        diff_rate_df = self.sbae_result_view.diff_rate_df
+        if diff_rate_df is None:
+            self.alert.add_msg(cm.sbae.no_results, "warning")
+            return
+
+        class_ = self.sbae_result_view.w_classes.v_model
+        error = (
+            diff_rate_df.loc[class_]
+            if class_ in diff_rate_df.index
+            else diff_rate_df.max()
+        )
+
+        new_grid_sizes = refine_grid_sizes(error, float(self.w_target.v_model or 0))
+        if not new_grid_sizes:
+            self.alert.add_msg(cm.sbae.refined, "info")
+            return
+
+        self.w_grid_sizes.v_model = get_grid_sizes(self.model) + new_grid_sizes
+        self._compute_sbae(widget, event, data)
+
+    def _optimize_sbae(self, widget, event, data):
+        """Event to search in the background the coarsest grid size meeting the target
+        error, for the selected class or for every class covering more than
+        param.MIN_CLASS_SHARE of the AOI"""
+
+        self._cancel_sbae()
+
+        if self.asset is None:
+            self.alert.add_msg(cm.error.non_cat_image, "error")
+            return
+
+        class_ = self.sbae_result_view.w_classes.v_model
+        grid_sizes = get_grid_sizes(self.model)
+
+        self.set_running(True)
+        self.alert.add_msg(cm.sbae.progress)
+
+        self.job = scheduler.submit(
+            find_grid_size,
+            lambda sizes: simulate_areas(
+                self.model, self.asset, single_pass=True, grid_sizes=sizes
+            ),
+            float(self.w_target.v_model or 0),
+            lower=grid_sizes[0],
+            upper=grid_sizes[-1],
+            classes=None if class_ is None else [class_],
+            min_share=param.MIN_CLASS_SHARE,
+            known=grid_sizes,
+            group="sbae",
+        )
+        self.job.add_done_callback(self._optimize_done)
+
+    def _optimize_done(self, future):
+        """report the grid size found and add it to the SBAE curve"""
+
+        if future is not self.job:
+            return
+
+        self.job = None
+        self.set_running(False)
+
+        error = future.exception()
+        if isinstance(error, Cancelled):
+            self.alert.add_msg(cm.sbae.cancelled, "warning")
+            return
+        elif error is not None:
+            self.alert.add_msg(str(error), "error")
+            return
+
+        grid_size, errors = future.result()
+        if grid_size is None:
+            self.alert.add_msg(cm.sbae.no_optimal.format(min(errors)), "warning")
+            return
+
+        # add the evaluated grid sizes to the curve, they are now read from the cache
+        self.w_grid_sizes.v_model = get_grid_sizes(self.model) + list(errors)
+        self.alert.add_msg(
+            cm.sbae.optimal.format(grid_size, errors[grid_size], len(errors)),
+            "success",
+        )
+
+    def _cancel_sbae(self, *args):
+        """cancel the running computation, the results already displayed are kept"""
+
+        scheduler.cancel("sbae")
+
+        if self.job is not None:
+            self.job = None
+            self.set_running(False)
+            self.alert.add_msg(cm.sbae.cancelled, "warning")
+
+    def set_running(self, running):
+        """toggle the buttons and the results card while a job is running"""
+
+        self.btn.loading = running
+        self.btn_cancel.show() if running else self.btn_cancel.hide()
+        self.sbae_result_view.loading = running
@@ -12,7 +12,14 @@ class SaveDialog(v.Dialog):
 
     reload = Int().tag(sync=True)
 
-    methods = {"csv": True, "gpkg": True, "shp": True, "asset": True, "gdrive": True}
+    methods = {
+        "csv": True,
+        "gpkg": True,
+        "shp": True,
+        "parquet": True,
+        "asset": True,
+        "gdrive": True,
+    }
     ee_formats = ["SHP", "GeoJSON", "KML", "KMZ", "CSV", "TFRecord"]
 
     def __init__(self, model, *args, **kwargs):
@@ -100,10 +107,7 @@ class SaveDialog(v.Dialog):
     def _save(self, *args):
         """trigger exportation method from model"""
 
-        # We only need to transform to dataframe if not in gee options
-        if self.model.export_method not in ["asset", "gdrive"]:
-            self.model.points_to_dataframe(self.alert)
-
-        result = self.model.export_result()
+        # Local formats are streamed to the file while the points are downloaded
+        result = self.model.export_result(alert=self.alert)
 
         self.alert.append_msg(result, type_="success")
@@ -0,0 +1,90 @@
+import types
+
+import numpy as np
+import pytest
+import shapely
+
+from component.scripts import local_sbae
+from component.scripts.cache import ResultCache
+from component.scripts.prepared_aoi import PreparedAoi
+
+CRS = "EPSG:3857"
+GRID_SIZES = [2000, 5000]
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(tmp_path, monkeypatch):
+    """every test starts with an empty result cache"""
+
+    monkeypatch.setattr(local_sbae, "cache", ResultCache(tmp_path / "cache"))
+
+
+@pytest.fixture
+def model():
+
+    aoi = shapely.box(0, 0, 20e3, 20e3)
+
+    return types.SimpleNamespace(
+        method="random",
+        shape="square",
+        n_points=2,
+        seed=1,
+        out_crs=CRS,
+        grid_size=5000,
+        allocation="proportional",
+        clip=False,
+        point_sampling=True,
+        prepared_aoi=PreparedAoi.from_geometry(aoi, CRS),
+    )
+
+
+@pytest.fixture
+def values():
+
+    return np.random.default_rng(0).integers(1, 4, (220, 220)).astype("uint8")
+
+
+GEOTRANSFORM = (-1000, 100, 0, 21000, 0, -100)
+
+
+@pytest.fixture(params=["memmap", "ndarray"])
+def raster(request, tmp_path, values):
+
+    if request.param == "ndarray":
+        return local_sbae.LocalRaster(values, GEOTRANSFORM, CRS)
+
+    path = tmp_path / "raster.bin"
+    values.tofile(path)
+
+    return local_sbae.LocalRaster.from_memmap(
+        path, values.shape, values.dtype, GEOTRANSFORM, CRS
+    )
+
+
+def test_simulate_parallel(model, raster):
+
+    seeds = [1, 2]
+    runs, real_area = local_sbae.simulate_parallel(
+        model, raster, seeds, refresh=True, grid_sizes=GRID_SIZES, processes=2
+    )
+
+    for seed, run in zip(seeds, runs):
+        model.seed = seed
+        expected, expected_real = local_sbae.simulate_areas(
+            model, raster, refresh=True, grid_sizes=GRID_SIZES
+        )
+        assert run == expected
+
+    assert real_area.keys() == expected_real.keys()
+    for key, area in expected_real.items():
+        assert real_area[key] == pytest.approx(area)
+
+
+def test_simulate_parallel_no_seed(model, raster):
+
+    runs, real_area = local_sbae.simulate_parallel(
+        model, raster, [], grid_sizes=GRID_SIZES, processes=2
+    )
+
+    assert runs == []
+    assert real_area.keys() == {"1", "2", "3"}